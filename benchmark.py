@@ -0,0 +1,535 @@
+# Benchmarks for fuel_system.py
+#
+#   python benchmark.py indexes [--sizes 10000 1000000 10000000] [--json out.json]
+#   python benchmark.py money [--sales 2000]
+#   python benchmark.py journal [--sales 2000] [--threads 16]
+#   python benchmark.py startup [--repeat 10]
+#   python benchmark.py login [--iterations 100000 200000 600000] [--repeat 5]
+#   python benchmark.py analytics [--rows 1000000]
+#   python benchmark.py suite [--rows 1000000] [--samples 200] --json results/<commit>.json
+#   python benchmark.py compare old.json new.json
+#
+# Every run works on a throw-away database in a temp directory, never on
+# fuel_system.db.
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import fuel_system as fs
+
+# The queries behind the admin screens, as the GUI runs them
+SCREEN_QUERIES = {
+    'view_all_transactions (first page)': ("""
+        SELECT t.id, e.name, ft.name, t.amount_cents, t.liters_ml, t.timestamp
+        FROM transactions t
+        JOIN employees e ON t.employee_id = e.id
+        JOIN fuel_types ft ON t.fuel_type_id = ft.id
+        ORDER BY t.timestamp DESC
+        LIMIT 100
+    """, ()),
+    'worker_tracking': ("""
+        SELECT e.id, e.name,
+               COUNT(t.id) as transaction_count,
+               SUM(t.amount_cents) as total_sales,
+               AVG(t.amount_cents) as avg_sale,
+               MAX(t.timestamp) as last_transaction
+        FROM employees e
+        LEFT JOIN transactions t ON e.id = t.employee_id
+        GROUP BY e.id
+        ORDER BY total_sales DESC
+    """, ()),
+    'view_reports': ("""
+        SELECT ft.name, SUM(t.amount_cents) as total_sales, SUM(t.liters_ml) as total_liters
+        FROM transactions t
+        JOIN fuel_types ft ON t.fuel_type_id = ft.id
+        GROUP BY ft.name
+    """, ()),
+    'employee day': ("""
+        SELECT COUNT(*), SUM(amount_cents) FROM transactions
+        WHERE employee_id = ? AND timestamp BETWEEN ? AND ?
+    """, (1001, '2024-06-01', '2024-06-02')),
+    'fuel type month': ("""
+        SELECT SUM(amount_cents), SUM(liters_ml) FROM transactions
+        WHERE fuel_type_id = ? AND timestamp BETWEEN ? AND ?
+    """, (1, '2024-06-01', '2024-07-01')),
+}
+
+TRANSACTION_INDEXES = ['idx_transactions_timestamp',
+                       'idx_transactions_employee_timestamp',
+                       'idx_transactions_fuel_type_timestamp']
+
+def use_temp_database(directory, name='bench.db'):
+    fs.close_pool()
+    fs.DATABASE_NAME = os.path.join(directory, name)
+    fs.setup_database()
+    return fs.DATABASE_NAME
+
+def seed_employees(count=50, first_id=1001):
+    with fs.db_connection() as conn:
+        conn.executemany("INSERT OR IGNORE INTO employees (id, name, password) VALUES (?, ?, ?)",
+                         [(first_id + i, f"Attendant {i}", fs.hashlib.sha256(b"bench").hexdigest())
+                          for i in range(count)])
+    return list(range(first_id, first_id + count))
+
+def seed_transactions(rows, employees=50, first_employee_id=1001, days=365):
+    # Generated inside SQLite: spreads `rows` sales evenly over `days` days
+    # starting 2024-01-01, with random attendants, fuels and amounts
+    with fs.db_connection() as conn:
+        fuel_ids = [row[0] for row in conn.execute("SELECT id FROM fuel_types ORDER BY id")]
+        conn.execute("""
+            WITH RECURSIVE n(x) AS (SELECT 0 UNION ALL SELECT x + 1 FROM n WHERE x < ? - 1),
+                 sale(x, cents) AS (SELECT x, 5000 + ABS(RANDOM()) % 95000 FROM n)
+            INSERT INTO transactions (employee_id, fuel_type_id, amount_cents, liters_ml, timestamp)
+            SELECT ? + ABS(RANDOM()) % ?,
+                   json_extract(?, '$[' || (ABS(RANDOM()) % ?) || ']'),
+                   cents,
+                   cents * 1000 / 1750,
+                   strftime('%Y-%m-%dT%H:%M:%f', '2024-01-01', '+' || (x * ? / ?) || ' seconds')
+            FROM sale
+        """, (rows, first_employee_id, employees, json.dumps(fuel_ids), len(fuel_ids), days * 86400, rows))
+    fs.rebuild_sales_rollups()
+
+def time_query(sql, params, repeat):
+    samples = []
+    with fs.db_connection() as conn:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+def time_screen_queries(repeat):
+    return {name: time_query(sql, params, repeat) for name, (sql, params) in SCREEN_QUERIES.items()}
+
+def bench_indexes(sizes, repeat=5):
+    results = []
+    for size in sizes:
+        directory = tempfile.mkdtemp(prefix='fuel_bench_')
+        try:
+            use_temp_database(directory)
+            seed_employees()
+            start = time.perf_counter()
+            seed_transactions(size)
+            seed_seconds = time.perf_counter() - start
+
+            with fs.db_connection() as conn:
+                index_sql = [row[0] for row in conn.execute(
+                    f"SELECT sql FROM sqlite_master WHERE name IN ({', '.join('?' * len(TRANSACTION_INDEXES))})",
+                    TRANSACTION_INDEXES)]
+                for index in TRANSACTION_INDEXES:
+                    conn.execute(f"DROP INDEX IF EXISTS {index}")
+                conn.execute("ANALYZE")
+            before = time_screen_queries(repeat)
+
+            with fs.db_connection() as conn:
+                for sql in index_sql:
+                    conn.execute(sql)
+                conn.execute("ANALYZE")
+            after = time_screen_queries(repeat)
+
+            results.append({'rows': size, 'seed_seconds': seed_seconds,
+                            'before': before, 'after': after})
+            print_index_result(results[-1])
+        finally:
+            fs.close_pool()
+            shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+def print_index_result(result):
+    print(f"\n{result['rows']:,} transactions (seeded in {result['seed_seconds']:.1f}s)")
+    print(f"  {'query':<38}{'before (ms)':>14}{'after (ms)':>14}{'speedup':>10}")
+    for name, before in result['before'].items():
+        after = result['after'][name]
+        print(f"  {name:<38}{before * 1000:>14.2f}{after * 1000:>14.2f}{before / after:>9.1f}x")
+
+def decimal_sale_math(price, stock, amount):
+    # The per-sale arithmetic of the float/Decimal sale path that fixed-point
+    # amounts replaced: REAL -> str -> Decimal on the way in, a Decimal pump
+    # tick every 100 ms, Decimal -> float on the way out
+    fuel_price = Decimal(str(price))
+    fuel_stock = Decimal(str(stock))
+    total_liters = Decimal(amount) / fuel_price
+    assert total_liters <= fuel_stock
+    pumped_liters = Decimal('0')
+    flow_rate = Decimal('0.5')
+    time_increment = Decimal('0.1')
+    while pumped_liters < total_liters:
+        pumped_liters += flow_rate * time_increment
+        if pumped_liters > total_liters:
+            pumped_liters = total_liters
+        progress = int((pumped_liters / total_liters) * 100)
+    return float(pumped_liters), float(pumped_liters * fuel_price), progress
+
+def fixed_point_sale_math(price_cents, stock_ml, amount):
+    sale = fs.FuelSale(0, 'Regular', 1, fs.Money(price_cents), fs.Money.parse(amount))
+    assert sale.target_ml <= stock_ml
+    tick = fs.PUMP_FLOW_RATE_ML * fs.PUMP_TICK_MS // 1000
+    while not sale.done:
+        sale.pumped_ml = min(sale.pumped_ml + tick, sale.target_ml)
+        progress = sale.progress
+    return sale.pumped_ml, sale.amount, progress
+
+def cpu_per_call(function, args, calls):
+    start = time.process_time()
+    for _ in range(calls):
+        function(*args)
+    return (time.process_time() - start) / calls
+
+def bench_money(sales=2000):
+    amount = '350.00'  # ~20 liters, ~400 pump ticks
+    before = cpu_per_call(decimal_sale_math, (17.8, 9964.349919743177, 350.0), sales)
+    after = cpu_per_call(fixed_point_sale_math, (1780, 9964350, amount), sales)
+
+    directory = tempfile.mkdtemp(prefix='fuel_bench_')
+    try:
+        use_temp_database(directory)
+        engine_sale = cpu_per_call(fs.transaction_engine.sell, (123456, 'Regular', amount), sales)
+    finally:
+        fs.close_pool()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    result = {'sales': sales, 'decimal_sale_math_us': before * 1e6, 'fixed_point_sale_math_us': after * 1e6,
+              'engine_sell_cpu_us': engine_sale * 1e6}
+    print(f"CPU per R{amount} sale (pump loop and conversions, no database):")
+    print(f"  float/Decimal  {before * 1e6:10.1f} us")
+    print(f"  fixed-point    {after * 1e6:10.1f} us  ({before / after:.1f}x less)")
+    print(f"Full TransactionEngine.sell incl. SQLite: {engine_sale * 1e6:.1f} us CPU per sale")
+    return result
+
+def concurrent_sales(sales, threads, amount='50.00'):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(lambda i: fs.transaction_engine.sell(123456, 'Regular', amount), range(sales)))
+    seconds = time.perf_counter() - start
+    assert all(error is None for _, error in results)
+    return seconds
+
+def bench_journal(sales=2000, threads=16):
+    result = {'sales': sales, 'threads': threads}
+    for mode in ('transaction', 'journal'):
+        directory = tempfile.mkdtemp(prefix='fuel_bench_')
+        try:
+            use_temp_database(directory)
+            if mode == 'journal':
+                fs.open_sale_journal()  # next to the temporary database
+            seconds = concurrent_sales(sales, threads)
+            fs.close_sale_journal()
+            with fs.db_connection() as conn:
+                recorded = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+            assert recorded == sales, (mode, recorded)
+        finally:
+            fs.close_sale_journal()
+            fs.close_pool()
+            shutil.rmtree(directory, ignore_errors=True)
+        result[f'{mode}_sales_per_second'] = sales / seconds
+        print(f"  {mode:<12}{sales / seconds:>12,.0f} sales/s")
+    return result
+
+HEAVY_MODULES = ['PySimpleGUI', 'tkinter', 'matplotlib', 'matplotlib.pyplot', 'keyboard', 'requests', 'schedule']
+
+# Run in a fresh interpreter each time so nothing is already imported
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import fuel_system
+imported = time.perf_counter()
+fuel_system.DATABASE_NAME = sys.argv[1]
+fuel_system.setup_database()
+ready = time.perf_counter()
+print(json.dumps({'import': imported - start, 'ready': ready - start,
+                  'loaded': [name for name in json.loads(sys.argv[2]) if name in sys.modules]}))
+"""
+
+def bench_startup(repeat=10):
+    directory = tempfile.mkdtemp(prefix='fuel_bench_')
+    runs = []
+    try:
+        database = os.path.join(directory, 'bench.db')
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, database, json.dumps(HEAVY_MODULES)],
+                                    cwd=os.path.dirname(os.path.abspath(fs.__file__)),
+                                    capture_output=True, text=True, check=True).stdout
+            runs.append(json.loads(output.splitlines()[-1]))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    result = {'repeat': repeat,
+              'import_ms': statistics.median(run['import'] for run in runs) * 1000,
+              'ready_ms': statistics.median(run['ready'] for run in runs) * 1000,
+              'heavy_modules_loaded': runs[-1]['loaded']}
+    print(f"import fuel_system          {result['import_ms']:8.1f} ms (median of {repeat})")
+    print(f"  + setup_database          {result['ready_ms']:8.1f} ms")
+    print(f"heavy modules loaded: {', '.join(result['heavy_modules_loaded']) or 'none'}")
+    return result
+
+def login_latency(username, password, repeat):
+    samples = []
+    for _ in range(repeat):
+        fs.login_cache.forget()
+        start = time.perf_counter()
+        assert fs.authenticate_admin(username, password)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+def bench_login(iterations=(100_000, 200_000, 600_000), repeat=5):
+    directory = tempfile.mkdtemp(prefix='fuel_bench_')
+    result = {'repeat': repeat, 'current_iterations': fs.PASSWORD_ITERATIONS, 'kdf_ms': {}}
+    try:
+        use_temp_database(directory)
+        with fs.db_connection() as conn:
+            conn.execute("INSERT INTO admins (username, password) VALUES (?, ?)",
+                         ('legacy', fs.hashlib.sha256(b'bench').hexdigest()))
+        start = time.perf_counter()
+        fs.authenticate_admin('legacy', 'bench')
+        result['legacy_first_login_ms'] = (time.perf_counter() - start) * 1000  # includes the rehash
+
+        for count in iterations:
+            with fs.db_connection() as conn:
+                conn.execute("UPDATE admins SET password = ? WHERE username = 'admin'",
+                             (fs.hash_password('admin_pass', count),))
+            saved, fs.PASSWORD_ITERATIONS = fs.PASSWORD_ITERATIONS, count  # no rehash while timing
+            try:
+                result['kdf_ms'][count] = login_latency('admin', 'admin_pass', repeat) * 1000
+            finally:
+                fs.PASSWORD_ITERATIONS = saved
+
+        samples = []
+        for _ in range(repeat * 100):
+            start = time.perf_counter()
+            fs.authenticate_admin('admin', 'admin_pass')
+            samples.append(time.perf_counter() - start)
+        result['cached_login_us'] = statistics.median(samples) * 1e6
+    finally:
+        fs.login_cache.forget()
+        fs.close_pool()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"Login latency (median of {repeat}), FUEL_PASSWORD_ITERATIONS currently {fs.PASSWORD_ITERATIONS:,}:")
+    for count, ms in result['kdf_ms'].items():
+        print(f"  {count:>10,} iterations  {ms:8.1f} ms")
+    print(f"  legacy SHA-256 row, first login incl. rehash  {result['legacy_first_login_ms']:8.1f} ms")
+    print(f"  cached repeat login                           {result['cached_login_us']:8.1f} us")
+    return result
+
+# One GROUP BY per cut: what the analytics engine answers from a single load
+SQL_CUTS = {
+    'hour': "strftime('%Y-%m-%d %H', timestamp)",
+    'day': "date(timestamp)",
+    'week': "date(timestamp, '-' || ((strftime('%w', timestamp) + 6) % 7) || ' days')",
+}
+
+def bench_analytics(rows=1_000_000):
+    start, end = '2024-01-01', '2025-01-01'
+    directory = tempfile.mkdtemp(prefix='fuel_bench_')
+    try:
+        use_temp_database(directory)
+        seed_employees()
+        seed_transactions(rows)
+
+        started = time.perf_counter()
+        with fs.db_connection() as conn:
+            for expression in SQL_CUTS.values():
+                conn.execute(f"""SELECT {expression}, COUNT(*), SUM(amount_cents), SUM(liters_ml), AVG(amount_cents)
+                                 FROM transactions WHERE timestamp >= ? AND timestamp < ? GROUP BY 1""",
+                             (start, end)).fetchall()
+            conn.execute("""SELECT employee_id, strftime('%H', timestamp), COUNT(*), SUM(amount_cents)
+                            FROM transactions WHERE timestamp >= ? AND timestamp < ? GROUP BY 1, 2""",
+                         (start, end)).fetchall()
+        sql_seconds = time.perf_counter() - started
+
+        analytics = fs.SalesAnalytics()
+        started = time.perf_counter()
+        for period in fs.ANALYTICS_PERIODS:
+            analytics.report(start, end, period)
+        analytics.heatmap(start, end)
+        engine_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for period in fs.ANALYTICS_PERIODS:
+            analytics.report(start, end, period)
+        cached_seconds = time.perf_counter() - started
+    finally:
+        fs.close_pool()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    result = {'rows': rows, 'sql_group_by_seconds': sql_seconds, 'engine_seconds': engine_seconds,
+              'engine_cached_seconds': cached_seconds}
+    print(f"{rows:,} transactions over a year; hour/day/week reports + employee heatmap:")
+    print(f"  SQL GROUP BY per cut (no percentiles)  {sql_seconds:8.2f} s")
+    print(f"  SalesAnalytics, incl. loading          {engine_seconds:8.2f} s")
+    print(f"  SalesAnalytics, cached range           {cached_seconds * 1000:8.2f} ms")
+    return result
+
+def latency_stats(samples):
+    samples = sorted(samples)
+    total = sum(samples)
+    return {'samples': len(samples), 'ops_per_second': len(samples) / total if total else 0.0,
+            'p50_ms': samples[len(samples) // 2] * 1000,
+            'p99_ms': samples[min(len(samples) - 1, len(samples) * 99 // 100)] * 1000,
+            'mean_ms': total / len(samples) * 1000}
+
+def measure(function, samples, setup=None):
+    timings = []
+    for i in range(samples):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function(i)
+        timings.append(time.perf_counter() - start)
+    return latency_stats(timings)
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(fs.__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def bench_suite(rows=1_000_000, samples=200, threads=8):
+    # The full sale path and the admin screens against a seeded history
+    directory = tempfile.mkdtemp(prefix='fuel_bench_')
+    result = {'commit': git_commit(), 'run_at': datetime.datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(), 'sqlite': fs.sqlite3.sqlite_version,
+              'rows': rows, 'samples': samples, 'threads': threads, 'operations': {}}
+    operations = result['operations']
+    try:
+        use_temp_database(directory)
+        employees = seed_employees()
+        start = time.perf_counter()
+        seed_transactions(rows)
+        result['seed_seconds'] = time.perf_counter() - start
+        with fs.db_connection() as conn:
+            conn.execute("UPDATE employees SET password = ? WHERE id = ?", (fs.hash_password('bench'), employees[0]))
+            conn.execute("UPDATE fuel_types SET stock_ml = ?", (10 ** 12,))  # never the limiting factor
+
+        auth_samples = max(5, samples // 20)  # each one runs the full KDF
+        operations['authenticate (KDF)'] = measure(lambda i: fs.authenticate_user(employees[0], 'bench'),
+                                                   auth_samples, setup=fs.login_cache.forget)
+        operations['authenticate (cached)'] = measure(lambda i: fs.authenticate_user(employees[0], 'bench'), samples)
+        fuels = list(fs.get_fuel_types())
+        operations['sale'] = measure(
+            lambda i: fs.transaction_engine.sell(employees[i % len(employees)], fuels[i % len(fuels)], '200.00'),
+            samples)
+        operations['invoice'] = measure(
+            lambda i: fs.generate_invoice(employees[i % len(employees)], fuels[0], fs.Money(20000), fs.Volume(11236)),
+            samples)
+
+        start = time.perf_counter()
+        concurrent_sales(samples, threads, '200.00')
+        seconds = time.perf_counter() - start
+        operations[f'sale ({threads} threads)'] = {'samples': samples, 'ops_per_second': samples / seconds}
+
+        operations['view_reports'] = measure(lambda i: fs.get_sales_by_fuel(), samples)
+        operations['worker_tracking'] = measure(lambda i: fs.get_worker_stats(), samples)
+        operations['generate_reports'] = measure(lambda i: fs.generate_reports(), max(5, samples // 20))
+        browser = fs.TransactionBrowser()
+        operations['transaction page'] = measure(lambda i: browser.page(i % 20), samples,
+                                                 setup=lambda: browser._pages.clear())
+        export_file = os.path.join(directory, 'export.csv')
+        export = fs.export_transactions(export_file)
+        operations['export'] = {'samples': 1, 'rows': export['rows'], 'seconds': export['seconds'],
+                                'rows_per_second': export['rows_per_second']}
+    finally:
+        fs.login_cache.forget()
+        fs.close_pool()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"{rows:,} seeded transactions, commit {result['commit'] or 'unknown'}")
+    print(f"  {'operation':<26}{'ops/s':>12}{'p50 (ms)':>12}{'p99 (ms)':>12}")
+    for name, stats in operations.items():
+        if 'rows_per_second' in stats:
+            print(f"  {name:<26}{stats['rows_per_second']:>12,.0f} rows/s")
+            continue
+        p50 = f"{stats['p50_ms']:12.3f}{stats['p99_ms']:12.3f}" if 'p50_ms' in stats else ""
+        print(f"  {name:<26}{stats['ops_per_second']:>12,.1f}{p50}")
+    return result
+
+def compare_results(old_file, new_file):
+    with open(old_file) as file:
+        old = json.load(file)
+    with open(new_file) as file:
+        new = json.load(file)
+    print(f"{old.get('commit') or old_file} -> {new.get('commit') or new_file}")
+    print(f"  {'operation':<26}{'old p50':>10}{'new p50':>10}{'old p99':>10}{'new p99':>10}{'throughput':>12}")
+    changes = {}
+    for name, stats in new['operations'].items():
+        before = old['operations'].get(name)
+        if before is None:
+            continue
+        key = 'rows_per_second' if 'rows_per_second' in stats else 'ops_per_second'
+        change = stats[key] / before[key] - 1 if before.get(key) else 0.0
+        changes[name] = change
+        latency = ''.join(f"{row.get(column, float('nan')):10.3f}" for column in ('p50_ms', 'p99_ms')
+                          for row in (before, stats))
+        print(f"  {name:<26}{latency}{change:>+11.1%}")
+    return changes
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuel-MS benchmarks")
+    parser.add_argument('--json', help="also write the results to this file")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    indexes = commands.add_parser('indexes', help="admin screen queries before/after the transaction indexes")
+    indexes.add_argument('--sizes', type=int, nargs='+', default=[10_000, 1_000_000, 10_000_000])
+    indexes.add_argument('--repeat', type=int, default=5)
+
+    money = commands.add_parser('money', help="per-sale CPU cost of float/Decimal vs fixed-point amounts")
+    money.add_argument('--sales', type=int, default=2000)
+
+    journal = commands.add_parser('journal', help="concurrent sale throughput: per-sale transactions vs the sale journal")
+    journal.add_argument('--sales', type=int, default=2000)
+    journal.add_argument('--threads', type=int, default=16)
+
+    startup = commands.add_parser('startup', help="cold import and database setup time in a fresh interpreter")
+    startup.add_argument('--repeat', type=int, default=10)
+
+    login = commands.add_parser('login', help="login latency per PBKDF2 cost, for tuning FUEL_PASSWORD_ITERATIONS")
+    login.add_argument('--iterations', type=int, nargs='+', default=[100_000, 200_000, 600_000])
+    login.add_argument('--repeat', type=int, default=5)
+
+    analytics = commands.add_parser('analytics', help="vectorised analytics engine vs one SQL query per cut")
+    analytics.add_argument('--rows', type=int, default=1_000_000)
+
+    suite = commands.add_parser('suite', help="throughput and p50/p99 latency of the sale path and admin screens")
+    suite.add_argument('--rows', type=int, default=1_000_000)
+    suite.add_argument('--samples', type=int, default=200)
+    suite.add_argument('--threads', type=int, default=8)
+
+    compare = commands.add_parser('compare', help="compare two 'suite --json' result files")
+    compare.add_argument('old')
+    compare.add_argument('new')
+
+    args = parser.parse_args()
+    if args.command == 'indexes':
+        results = bench_indexes(args.sizes, args.repeat)
+    elif args.command == 'money':
+        results = bench_money(args.sales)
+    elif args.command == 'journal':
+        results = bench_journal(args.sales, args.threads)
+    elif args.command == 'startup':
+        results = bench_startup(args.repeat)
+    elif args.command == 'login':
+        results = bench_login(args.iterations, args.repeat)
+    elif args.command == 'analytics':
+        results = bench_analytics(args.rows)
+    elif args.command == 'suite':
+        results = bench_suite(args.rows, args.samples, args.threads)
+    elif args.command == 'compare':
+        results = compare_results(args.old, args.new)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,49 @@
 import sqlite3
+import argparse
+import functools
+import bisect
 import hashlib
-from decimal import Decimal
+import hmac
+from decimal import Decimal, ROUND_HALF_UP
 import datetime
-import PySimpleGUI as sg
-import matplotlib.pyplot as plt
+import importlib
 from io import BytesIO
-import matplotlib.pyplot as plt
 import csv
-import keyboard
-import requests
-import schedule
+import gzip
 import time
-from threading import Thread
+from threading import Thread, Lock, Condition, local
 import json
+import string
+import zlib
+import math
 import os
+import sys
+import queue
+import socket
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
 #import datetime
 #sfrom datetime import datetime
 
+class _LazyModule:
+    # Stands in for a heavy module and imports it on first attribute access,
+    # so headless uses (CLI, benchmarks) never load the GUI or plotting stack
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+sg = _LazyModule('PySimpleGUI')
+mpl_figure = _LazyModule('matplotlib.figure')
+keyboard = _LazyModule('keyboard')
+schedule = _LazyModule('schedule')
+asyncio = _LazyModule('asyncio')  # only the pump scheduler needs it
+np = _LazyModule('numpy')
+
 # Company name
 COMPANY_NAME = "Jet Refuels"
 
@@ -30,71 +57,832 @@ def adapt_datetime(dt):
 
 sqlite3.register_adapter(datetime.datetime, adapt_datetime)
 
+# Fixed-point quantities: money in integer cents, volumes in integer
+# milliliters. They are plain ints underneath, so SQLite stores and SUMs them
+# exactly and the pump loop does integer maths; Decimal only shows up when a
+# value is parsed from user input or formatted for display.
+class FixedPoint(int):
+    __slots__ = ()
+    SCALE = 1
+    PLACES = 0
+
+    @classmethod
+    def parse(cls, value):
+        # Whole units as str/float/Decimal -> scaled int, rounding half up
+        if isinstance(value, cls):
+            return value
+        scaled = Decimal(str(value)) * cls.SCALE
+        if not scaled.is_finite():
+            raise ValueError(f"Invalid {cls.__name__.lower()}: {value}")
+        return cls(scaled.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+    def to_decimal(self):
+        return Decimal(int(self)).scaleb(-self.PLACES)
+
+    def __format__(self, spec):
+        return format(self.to_decimal(), spec or f'.{self.PLACES}f')
+
+    def __str__(self):
+        return format(self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}('{self}')"
+
+class Money(FixedPoint):
+    __slots__ = ()
+    SCALE = 100
+    PLACES = 2
+
+class Volume(FixedPoint):
+    __slots__ = ()
+    SCALE = 1000
+    PLACES = 3
+
+# Metrics settings
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
+SLOW_QUERY_SECONDS = 0.1
+SLOW_QUERY_LOG = 100  # most recent slow statements kept
+def _metrics_port_from_env():
+    # Metrics are optional: a bad value turns the exporter off, it must not stop the terminal
+    value = os.environ.get('FUEL_METRICS_PORT', '').strip()
+    if not value:
+        return None
+    if not value.isdigit() or not 0 <= int(value) <= 65535:
+        print(f"Ignoring FUEL_METRICS_PORT={value!r}: not a port number, metrics exporter disabled")
+        return None
+    return int(value) or None
+
+METRICS_PORT = _metrics_port_from_env()  # local HTTP exposition, off by default
+METRICS_FILE = os.environ.get('FUEL_METRICS_FILE')  # periodic text dump, off by default
+METRICS_DUMP_SECONDS = 15
+
+# In-process counters and latency histograms, rendered in the Prometheus text
+# format. Series are keyed by name plus sorted labels; histograms keep one
+# count per METRICS_BUCKETS bound plus an overflow count and a running sum.
+class Metrics:
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+            self.slow_queries = deque(maxlen=SLOW_QUERY_LOG)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        bucket = bisect.bisect_left(METRICS_BUCKETS, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(METRICS_BUCKETS) + 1) + [0.0]
+            histogram[bucket] += 1
+            histogram[-1] += seconds
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        # Decorator form of timer()
+        def decorate(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def observe_query(self, sql, seconds):
+        words = sql.split(None, 1)
+        self.observe('db_query_seconds', seconds, statement=words[0].upper() if words else '')
+        if seconds >= SLOW_QUERY_SECONDS:
+            self.inc('db_slow_queries_total')
+            with self._lock:
+                self.slow_queries.append((datetime.datetime.now().isoformat(timespec='seconds'), seconds,
+                                          ' '.join(sql.split())[:500]))
+
+    def snapshot(self):
+        with self._lock:
+            return {'counters': dict(self._counters),
+                    'histograms': {key: list(values) for key, values in self._histograms.items()},
+                    'slow_queries': list(self.slow_queries)}
+
+    def render(self):
+        def series(name, labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return name
+            return name + '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+        snapshot = self.snapshot()
+        lines = []
+        family = None
+        for (name, labels), value in sorted(snapshot['counters'].items()):
+            if name != family:
+                family = name
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{series(name, labels)} {value}")
+        for (name, labels), values in sorted(snapshot['histograms'].items()):
+            if name != family:
+                family = name
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(list(METRICS_BUCKETS) + ['+Inf'], values[:-1]):
+                cumulative += count
+                lines.append(f"{series(name + '_bucket', labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{series(name + '_sum', labels)} {values[-1]:.6f}")
+            lines.append(f"{series(name + '_count', labels)} {cumulative}")
+        for at, seconds, sql in snapshot['slow_queries']:
+            lines.append(f"# slow query {at} {seconds * 1000:.1f}ms: {sql}")
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        # Written to a temp file first, so readers never see half a dump
+        with open(path + '.tmp', 'w') as file:
+            file.write(self.render())
+        os.replace(path + '.tmp', path)
+
+metrics = Metrics()
+
+def serve_metrics(port=None, host='127.0.0.1'):
+    # GET /metrics on a local port from a daemon thread
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port or METRICS_PORT), MetricsHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def start_metrics_dump(path=None, interval=METRICS_DUMP_SECONDS):
+    path = path or METRICS_FILE
+
+    def run():
+        while True:
+            time.sleep(interval)
+            metrics.dump(path)
+
+    thread = Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+@contextmanager
+def profiling(path):
+    # Opt-in cProfile of a block; read the result with `python -m pstats PATH`
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+# Every statement run through a pooled connection is timed (execution only,
+# not fetching) and counted per statement kind; slow ones are logged
+class _InstrumentedConnection(sqlite3.Connection):
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.observe_query(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            metrics.observe_query(sql, time.perf_counter() - start)
+
+    def commit(self):
+        with metrics.timer('db_commit_seconds'):
+            super().commit()
+
+# Connection pool settings
+DB_POOL_SIZE = 4
+DB_TIMEOUT = 30  # seconds to wait for a lock or a free connection
+DB_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,  # negative means KiB, so ~16 MB of page cache
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+DB_STATEMENT_CACHE = 256
+
+# Long-lived connections are opened lazily up to `size` and reused, so the
+# sqlite3 statement cache keeps the hot queries prepared between calls.
+# A thread that already holds a connection gets the same one back (nested
+# helpers share the caller's unit of work instead of checking out another).
+class ConnectionPool:
+
+    def __init__(self, database, size=DB_POOL_SIZE, timeout=DB_TIMEOUT):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = Lock()
+        self._held = local()
+        self._closed = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=DB_STATEMENT_CACHE, factory=_InstrumentedConnection)
+        for pragma, value in DB_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                open_new = True
+            else:
+                open_new = False
+        if open_new:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Timed out waiting for a database connection")
+
+    def _checkin(self, conn):
+        if self._closed:
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+        else:
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        held = getattr(self._held, 'conn', None)
+        if held is not None:
+            self._held.depth += 1
+            try:
+                yield held
+            finally:
+                self._held.depth -= 1
+            return
+
+        with metrics.timer('db_pool_wait_seconds'):
+            conn = self._checkout()
+        self._held.conn = conn
+        self._held.depth = 1
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._held.conn = None
+            self._held.depth = 0
+            self._checkin(conn)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+_pool = None
+_pool_lock = Lock()
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        # Re-create the pool if DATABASE_NAME was pointed somewhere else
+        if _pool is None or _pool.database != DATABASE_NAME:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(DATABASE_NAME)
+        return _pool
+
+def db_connection():
+    # Commits on a clean exit, rolls back on an exception
+    return get_pool().connection()
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+@contextmanager
+def write_transaction():
+    # BEGIN IMMEDIATE takes the write lock up front, so a read-check-update
+    # inside the block cannot interleave with another writer
+    with db_connection() as conn:
+        if not conn.in_transaction:
+            with metrics.timer('db_lock_wait_seconds'):
+                conn.execute("BEGIN IMMEDIATE")
+        yield conn
+
+# Schema migrations: (version, step) pairs applied in order by
+# migrate_database(). Append new steps at the end, never edit old ones.
+def _migration_transaction_indexes(conn):
+    # Leading columns serve the ORDER BY / GROUP BY / JOIN of the admin
+    # screens; the trailing ones let those queries run off the index alone
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_transactions_timestamp
+                    ON transactions (timestamp)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_transactions_employee_timestamp
+                    ON transactions (employee_id, timestamp, amount)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_transactions_fuel_type_timestamp
+                    ON transactions (fuel_type_id, timestamp, amount, liters)''')
+
+def _migration_unique_fuel_type_names(conn):
+    # Older databases picked up a copy of every fuel type on each start.
+    # Keep the oldest row per name and point history at it.
+    duplicates = conn.execute('''SELECT ft.id, keep.id FROM fuel_types ft
+                                  JOIN (SELECT name, MIN(id) AS id FROM fuel_types GROUP BY name) keep
+                                    ON ft.name = keep.name AND ft.id != keep.id''').fetchall()
+    remap = [(keep_id, dup_id) for dup_id, keep_id in duplicates]
+    conn.executemany("UPDATE transactions SET fuel_type_id = ? WHERE fuel_type_id = ?", remap)
+    conn.executemany("UPDATE stock_reservations SET fuel_type_id = ? WHERE fuel_type_id = ?", remap)
+    conn.executemany("DELETE FROM fuel_types WHERE id = ?", [(dup_id,) for dup_id, _ in duplicates])
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_fuel_types_name ON fuel_types (name)")
+
+def _migration_unique_admin_usernames(conn):
+    conn.execute("DELETE FROM admins WHERE id NOT IN (SELECT MIN(id) FROM admins GROUP BY username)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_admins_username ON admins (username)")
+
+def _migration_sales_rollups(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS sales_by_fuel
+                    (fuel_type_id INTEGER PRIMARY KEY, sale_count INTEGER NOT NULL DEFAULT 0,
+                     total_amount REAL NOT NULL DEFAULT 0, total_liters REAL NOT NULL DEFAULT 0)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS sales_by_employee
+                    (employee_id INTEGER PRIMARY KEY, sale_count INTEGER NOT NULL DEFAULT 0,
+                     total_amount REAL NOT NULL DEFAULT 0, total_liters REAL NOT NULL DEFAULT 0,
+                     last_transaction DATETIME)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS sales_by_hour
+                    (hour TEXT, fuel_type_id INTEGER, sale_count INTEGER NOT NULL DEFAULT 0,
+                     total_amount REAL NOT NULL DEFAULT 0, total_liters REAL NOT NULL DEFAULT 0,
+                     PRIMARY KEY (hour, fuel_type_id))''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS sales_by_day
+                    (day TEXT, fuel_type_id INTEGER, sale_count INTEGER NOT NULL DEFAULT 0,
+                     total_amount REAL NOT NULL DEFAULT 0, total_liters REAL NOT NULL DEFAULT 0,
+                     PRIMARY KEY (day, fuel_type_id))''')
+    # The original backfill, spelled out against this version's REAL
+    # amount/liters columns: rebuild_sales_rollups() now targets the
+    # fixed-point ones and would fail here
+    conn.execute('''INSERT INTO sales_by_fuel (fuel_type_id, sale_count, total_amount, total_liters)
+                    SELECT fuel_type_id, COUNT(*), SUM(amount), SUM(liters)
+                    FROM transactions GROUP BY fuel_type_id''')
+    conn.execute('''INSERT INTO sales_by_employee (employee_id, sale_count, total_amount, total_liters, last_transaction)
+                    SELECT employee_id, COUNT(*), SUM(amount), SUM(liters), MAX(timestamp)
+                    FROM transactions GROUP BY employee_id''')
+    conn.execute('''INSERT INTO sales_by_hour (hour, fuel_type_id, sale_count, total_amount, total_liters)
+                    SELECT substr(timestamp, 1, 13), fuel_type_id, COUNT(*), SUM(amount), SUM(liters)
+                    FROM transactions GROUP BY 1, 2''')
+    conn.execute('''INSERT INTO sales_by_day (day, fuel_type_id, sale_count, total_amount, total_liters)
+                    SELECT substr(timestamp, 1, 10), fuel_type_id, COUNT(*), SUM(amount), SUM(liters)
+                    FROM transactions GROUP BY 1, 2''')
+
+def _migration_export_checkpoints(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS export_checkpoints
+                    (name TEXT PRIMARY KEY, last_id INTEGER NOT NULL, exported_at DATETIME)''')
+
+def _migration_fixed_point_amounts(conn):
+    # REAL rands/liters become integer cents/milliliters
+    for table, old, new, scale in [('fuel_types', 'price', 'price_cents', 100),
+                                   ('fuel_types', 'stock', 'stock_ml', 1000),
+                                   ('transactions', 'amount', 'amount_cents', 100),
+                                   ('transactions', 'liters', 'liters_ml', 1000)]:
+        conn.execute(f"ALTER TABLE {table} RENAME COLUMN {old} TO {new}")
+        conn.execute(f"UPDATE {table} SET {new} = CAST(ROUND({new} * {scale}) AS INTEGER)")
+
+    # REAL affinity would store the new integers as floats again, so these
+    # tables are recreated with INTEGER columns
+    conn.execute('''CREATE TABLE stock_reservations_ml
+                    (id INTEGER PRIMARY KEY, fuel_type_id INTEGER, employee_id INTEGER,
+                     ml INTEGER, created_at DATETIME, expires_at DATETIME)''')
+    conn.execute('''INSERT INTO stock_reservations_ml
+                    SELECT id, fuel_type_id, employee_id, CAST(ROUND(liters * 1000) AS INTEGER), created_at, expires_at
+                    FROM stock_reservations''')
+    conn.execute("DROP TABLE stock_reservations")
+    conn.execute("ALTER TABLE stock_reservations_ml RENAME TO stock_reservations")
+    conn.execute("CREATE INDEX idx_stock_reservations_expires_at ON stock_reservations (expires_at)")
+
+    for table in ('sales_by_fuel', 'sales_by_employee', 'sales_by_hour', 'sales_by_day'):
+        conn.execute(f"DROP TABLE {table}")
+    conn.execute('''CREATE TABLE sales_by_fuel
+                    (fuel_type_id INTEGER PRIMARY KEY, sale_count INTEGER NOT NULL DEFAULT 0,
+                     total_cents INTEGER NOT NULL DEFAULT 0, total_ml INTEGER NOT NULL DEFAULT 0)''')
+    conn.execute('''CREATE TABLE sales_by_employee
+                    (employee_id INTEGER PRIMARY KEY, sale_count INTEGER NOT NULL DEFAULT 0,
+                     total_cents INTEGER NOT NULL DEFAULT 0, total_ml INTEGER NOT NULL DEFAULT 0,
+                     last_transaction DATETIME)''')
+    conn.execute('''CREATE TABLE sales_by_hour
+                    (hour TEXT, fuel_type_id INTEGER, sale_count INTEGER NOT NULL DEFAULT 0,
+                     total_cents INTEGER NOT NULL DEFAULT 0, total_ml INTEGER NOT NULL DEFAULT 0,
+                     PRIMARY KEY (hour, fuel_type_id))''')
+    conn.execute('''CREATE TABLE sales_by_day
+                    (day TEXT, fuel_type_id INTEGER, sale_count INTEGER NOT NULL DEFAULT 0,
+                     total_cents INTEGER NOT NULL DEFAULT 0, total_ml INTEGER NOT NULL DEFAULT 0,
+                     PRIMARY KEY (day, fuel_type_id))''')
+    rebuild_sales_rollups(conn)
+
+def _migration_sale_journal_state(conn):
+    # Sequence number of the last sale journal record applied to this database
+    conn.execute('''CREATE TABLE IF NOT EXISTS sale_journal_state
+                    (id INTEGER PRIMARY KEY CHECK (id = 1), applied_seq INTEGER NOT NULL)''')
+    conn.execute("INSERT OR IGNORE INTO sale_journal_state (id, applied_seq) VALUES (1, 0)")
+
+def _migration_receipts(conn):
+    # Rendered receipts, deflate-compressed, one row per transaction
+    conn.execute('''CREATE TABLE IF NOT EXISTS receipts
+                    (transaction_id INTEGER PRIMARY KEY, template_version INTEGER NOT NULL, receipt BLOB NOT NULL)''')
+
+def _migration_shifts(conn):
+    # Shift and business-day records (kind 'shift' per employee and pump,
+    # kind 'day' for the whole site), their running sales totals per fuel and
+    # the stock snapshots taken when they open and close
+    conn.execute('''CREATE TABLE IF NOT EXISTS shifts
+                    (id INTEGER PRIMARY KEY, kind TEXT NOT NULL, employee_id INTEGER, pump INTEGER,
+                     business_day TEXT NOT NULL, opened_at DATETIME NOT NULL, closed_at DATETIME, z_report TEXT)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_shifts_open ON shifts (kind, employee_id) WHERE closed_at IS NULL")
+    conn.execute('''CREATE TABLE IF NOT EXISTS shift_totals
+                    (shift_id INTEGER, fuel_type_id INTEGER, sale_count INTEGER NOT NULL DEFAULT 0,
+                     total_cents INTEGER NOT NULL DEFAULT 0, total_ml INTEGER NOT NULL DEFAULT 0,
+                     PRIMARY KEY (shift_id, fuel_type_id))''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS shift_stock
+                    (shift_id INTEGER, fuel_type_id INTEGER,
+                     opening_stock_ml INTEGER, opening_sold_ml INTEGER, opening_delivered_ml INTEGER,
+                     closing_stock_ml INTEGER, closing_sold_ml INTEGER, closing_delivered_ml INTEGER,
+                     PRIMARY KEY (shift_id, fuel_type_id))''')
+    # Lifetime deliveries per tank: with sales_by_fuel.total_ml this lets two
+    # snapshots separate deliveries and sales from unexplained stock changes
+    conn.execute('''CREATE TABLE IF NOT EXISTS stock_deliveries
+                    (fuel_type_id INTEGER PRIMARY KEY, delivered_ml INTEGER NOT NULL DEFAULT 0)''')
+
+def _migration_change_events(conn):
+    # Change feed: triggers append one row per committed sale, price change
+    # and stock change, whatever code path made it (see ChangeFeed)
+    conn.execute('''CREATE TABLE IF NOT EXISTS change_events
+                    (id INTEGER PRIMARY KEY, kind TEXT NOT NULL, fuel_type_id INTEGER, ref_id INTEGER,
+                     value INTEGER, created_at DATETIME NOT NULL)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS change_feed_cursors
+                    (name TEXT PRIMARY KEY, last_id INTEGER NOT NULL, updated_at DATETIME)''')
+    now = "strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')"
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS change_events_sale AFTER INSERT ON transactions
+                     BEGIN
+                         INSERT INTO change_events (kind, fuel_type_id, ref_id, value, created_at)
+                         VALUES ('sale', NEW.fuel_type_id, NEW.id, NEW.amount_cents, {now});
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS change_events_price AFTER UPDATE OF price_cents ON fuel_types
+                     WHEN NEW.price_cents IS NOT OLD.price_cents
+                     BEGIN
+                         INSERT INTO change_events (kind, fuel_type_id, value, created_at)
+                         VALUES ('price', NEW.id, NEW.price_cents, {now});
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS change_events_stock AFTER UPDATE OF stock_ml ON fuel_types
+                     WHEN NEW.stock_ml IS NOT OLD.stock_ml
+                     BEGIN
+                         INSERT INTO change_events (kind, fuel_type_id, value, created_at)
+                         VALUES ('stock', NEW.id, NEW.stock_ml, {now});
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS change_events_fuel_added AFTER INSERT ON fuel_types
+                     BEGIN
+                         INSERT INTO change_events (kind, fuel_type_id, value, created_at)
+                         VALUES ('price', NEW.id, NEW.price_cents, {now}), ('stock', NEW.id, NEW.stock_ml, {now});
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS change_events_fuel_removed AFTER DELETE ON fuel_types
+                     BEGIN
+                         INSERT INTO change_events (kind, fuel_type_id, created_at)
+                         VALUES ('fuel_removed', OLD.id, {now});
+                     END''')
+
+def _migration_archive_partitions(conn):
+    # Manifest of the monthly archive files transactions were moved to
+    conn.execute('''CREATE TABLE IF NOT EXISTS archive_partitions
+                    (month TEXT PRIMARY KEY, file TEXT NOT NULL, first_id INTEGER, last_id INTEGER,
+                     row_count INTEGER NOT NULL, total_cents INTEGER NOT NULL, total_ml INTEGER NOT NULL,
+                     archived_at DATETIME)''')
+
+def _migration_database_id(conn):
+    # Random identity stamped into the sale journal, so a journal is only
+    # ever replayed into the database that wrote it
+    conn.execute("ALTER TABLE sale_journal_state ADD COLUMN database_id TEXT")
+    conn.execute("UPDATE sale_journal_state SET database_id = ? WHERE id = 1", (os.urandom(16).hex(),))
+
+MIGRATIONS = [
+    (1, _migration_transaction_indexes),
+    (2, _migration_unique_fuel_type_names),
+    (3, _migration_unique_admin_usernames),
+    (4, _migration_sales_rollups),
+    (5, _migration_export_checkpoints),
+    (6, _migration_fixed_point_amounts),
+    (7, _migration_sale_journal_state),
+    (8, _migration_receipts),
+    (9, _migration_shifts),
+    (10, _migration_change_events),
+    (11, _migration_archive_partitions),
+    (12, _migration_database_id),
+]
+
+def get_schema_version():
+    with db_connection() as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, applied_at DATETIME)")
+        return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def migrate_database(target=None):
+    # Runs every pending step in one write transaction; returns the new version
+    with write_transaction() as conn:
+        current = get_schema_version()
+        for version, step in MIGRATIONS:
+            if version <= current or (target is not None and version > target):
+                continue
+            step(conn)
+            conn.execute("INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+                         (version, datetime.datetime.now()))
+            current = version
+        return current
+
+# Rollup tables kept in step with `transactions` so the report screens read
+# a handful of pre-aggregated rows instead of scanning the whole history.
+# Hour and day keys are prefixes of the ISO timestamp ('2024-06-01T13', '2024-06-01').
+SALES_ROLLUP_UPSERTS = [
+    ('''INSERT INTO sales_by_fuel (fuel_type_id, sale_count, total_cents, total_ml)
+        VALUES (:fuel_type_id, 1, :amount_cents, :liters_ml)
+        ON CONFLICT (fuel_type_id) DO UPDATE SET sale_count = sale_count + 1,
+            total_cents = total_cents + excluded.total_cents,
+            total_ml = total_ml + excluded.total_ml'''),
+    ('''INSERT INTO sales_by_employee (employee_id, sale_count, total_cents, total_ml, last_transaction)
+        VALUES (:employee_id, 1, :amount_cents, :liters_ml, :timestamp)
+        ON CONFLICT (employee_id) DO UPDATE SET sale_count = sale_count + 1,
+            total_cents = total_cents + excluded.total_cents,
+            total_ml = total_ml + excluded.total_ml,
+            last_transaction = MAX(COALESCE(last_transaction, \'\'), excluded.last_transaction)'''),
+    ('''INSERT INTO sales_by_hour (hour, fuel_type_id, sale_count, total_cents, total_ml)
+        VALUES (substr(:timestamp, 1, 13), :fuel_type_id, 1, :amount_cents, :liters_ml)
+        ON CONFLICT (hour, fuel_type_id) DO UPDATE SET sale_count = sale_count + 1,
+            total_cents = total_cents + excluded.total_cents,
+            total_ml = total_ml + excluded.total_ml'''),
+    ('''INSERT INTO sales_by_day (day, fuel_type_id, sale_count, total_cents, total_ml)
+        VALUES (substr(:timestamp, 1, 10), :fuel_type_id, 1, :amount_cents, :liters_ml)
+        ON CONFLICT (day, fuel_type_id) DO UPDATE SET sale_count = sale_count + 1,
+            total_cents = total_cents + excluded.total_cents,
+            total_ml = total_ml + excluded.total_ml'''),
+    # The seller's open shift and the open business day, if any
+    ('''INSERT INTO shift_totals (shift_id, fuel_type_id, sale_count, total_cents, total_ml)
+        SELECT id, :fuel_type_id, 1, :amount_cents, :liters_ml FROM shifts
+        WHERE closed_at IS NULL AND (kind = 'day' OR (kind = 'shift' AND employee_id = :employee_id))
+        ON CONFLICT (shift_id, fuel_type_id) DO UPDATE SET sale_count = sale_count + 1,
+            total_cents = total_cents + excluded.total_cents,
+            total_ml = total_ml + excluded.total_ml'''),
+]
+
+def update_sales_rollups(conn, employee_id, fuel_type_id, amount_cents, liters_ml, timestamp):
+    # Must run in the same transaction as the INSERT INTO transactions
+    params = {'employee_id': employee_id, 'fuel_type_id': fuel_type_id, 'amount_cents': amount_cents,
+              'liters_ml': liters_ml, 'timestamp': adapt_datetime(timestamp)}
+    for sql in SALES_ROLLUP_UPSERTS:
+        conn.execute(sql, params)
+
+def rebuild_sales_rollups(conn=None):
+    # Recomputes every rollup from `transactions`, e.g. after a backfill
+    if conn is None:
+        with write_transaction() as conn:
+            return rebuild_sales_rollups(conn)
+    for table in ('sales_by_fuel', 'sales_by_employee', 'sales_by_hour', 'sales_by_day'):
+        conn.execute(f"DELETE FROM {table}")
+    conn.execute('''INSERT INTO sales_by_fuel (fuel_type_id, sale_count, total_cents, total_ml)
+                    SELECT fuel_type_id, COUNT(*), SUM(amount_cents), SUM(liters_ml)
+                    FROM transactions GROUP BY fuel_type_id''')
+    conn.execute('''INSERT INTO sales_by_employee (employee_id, sale_count, total_cents, total_ml, last_transaction)
+                    SELECT employee_id, COUNT(*), SUM(amount_cents), SUM(liters_ml), MAX(timestamp)
+                    FROM transactions GROUP BY employee_id''')
+    conn.execute('''INSERT INTO sales_by_hour (hour, fuel_type_id, sale_count, total_cents, total_ml)
+                    SELECT substr(timestamp, 1, 13), fuel_type_id, COUNT(*), SUM(amount_cents), SUM(liters_ml)
+                    FROM transactions GROUP BY 1, 2''')
+    conn.execute('''INSERT INTO sales_by_day (day, fuel_type_id, sale_count, total_cents, total_ml)
+                    SELECT substr(timestamp, 1, 10), fuel_type_id, COUNT(*), SUM(amount_cents), SUM(liters_ml)
+                    FROM transactions GROUP BY 1, 2''')
+    # Archived months cannot be ATTACHed inside this transaction: their
+    # groups are read over a connection of their own and added in
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'archive_partitions'").fetchone():
+        for (file,) in conn.execute("SELECT file FROM archive_partitions ORDER BY month").fetchall():
+            archive = sqlite3.connect(archive_path(file))
+            try:
+                for select, upsert in ARCHIVE_ROLLUP_MERGES:
+                    conn.executemany(upsert, archive.execute(select).fetchall())
+            finally:
+                archive.close()
+
+# (grouping over an archive file, upsert adding the groups to a rollup)
+ARCHIVE_ROLLUP_MERGES = [
+    ('''SELECT fuel_type_id, COUNT(*), SUM(amount_cents), SUM(liters_ml) FROM transactions GROUP BY 1''',
+     '''INSERT INTO sales_by_fuel (fuel_type_id, sale_count, total_cents, total_ml) VALUES (?, ?, ?, ?)
+        ON CONFLICT (fuel_type_id) DO UPDATE SET sale_count = sale_count + excluded.sale_count,
+            total_cents = total_cents + excluded.total_cents, total_ml = total_ml + excluded.total_ml'''),
+    ('''SELECT employee_id, COUNT(*), SUM(amount_cents), SUM(liters_ml), MAX(timestamp) FROM transactions GROUP BY 1''',
+     '''INSERT INTO sales_by_employee (employee_id, sale_count, total_cents, total_ml, last_transaction)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (employee_id) DO UPDATE SET sale_count = sale_count + excluded.sale_count,
+            total_cents = total_cents + excluded.total_cents, total_ml = total_ml + excluded.total_ml,
+            last_transaction = MAX(COALESCE(last_transaction, ''), excluded.last_transaction)'''),
+    ('''SELECT substr(timestamp, 1, 13), fuel_type_id, COUNT(*), SUM(amount_cents), SUM(liters_ml)
+        FROM transactions GROUP BY 1, 2''',
+     '''INSERT INTO sales_by_hour (hour, fuel_type_id, sale_count, total_cents, total_ml) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (hour, fuel_type_id) DO UPDATE SET sale_count = sale_count + excluded.sale_count,
+            total_cents = total_cents + excluded.total_cents, total_ml = total_ml + excluded.total_ml'''),
+    ('''SELECT substr(timestamp, 1, 10), fuel_type_id, COUNT(*), SUM(amount_cents), SUM(liters_ml)
+        FROM transactions GROUP BY 1, 2''',
+     '''INSERT INTO sales_by_day (day, fuel_type_id, sale_count, total_cents, total_ml) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (day, fuel_type_id) DO UPDATE SET sale_count = sale_count + excluded.sale_count,
+            total_cents = total_cents + excluded.total_cents, total_ml = total_ml + excluded.total_ml'''),
+]
+
 def setup_database():
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+    
+        cursor.execute('''CREATE TABLE IF NOT EXISTS employees
+                          (id INTEGER PRIMARY KEY, name TEXT, password TEXT)''')
+    
+        cursor.execute('''CREATE TABLE IF NOT EXISTS fuel_types
+                          (id INTEGER PRIMARY KEY, name TEXT, price DECIMAL(10, 2), stock DECIMAL(10, 2))''')
     
-    cursor.execute('''CREATE TABLE IF NOT EXISTS employees
-                      (id INTEGER PRIMARY KEY, name TEXT, password TEXT)''')
+        cursor.execute('''CREATE TABLE IF NOT EXISTS transactions
+                          (id INTEGER PRIMARY KEY, employee_id INTEGER, fuel_type_id INTEGER,
+                           amount DECIMAL(10, 2), liters DECIMAL(10, 2), timestamp DATETIME)''')
     
-    cursor.execute('''CREATE TABLE IF NOT EXISTS fuel_types
-                      (id INTEGER PRIMARY KEY, name TEXT, price DECIMAL(10, 2), stock DECIMAL(10, 2))''')
+        cursor.execute('''CREATE TABLE IF NOT EXISTS admins
+                          (id INTEGER PRIMARY KEY, username TEXT, password TEXT)''')
     
-    cursor.execute('''CREATE TABLE IF NOT EXISTS transactions
-                      (id INTEGER PRIMARY KEY, employee_id INTEGER, fuel_type_id INTEGER,
-                       amount DECIMAL(10, 2), liters DECIMAL(10, 2), timestamp DATETIME)''')
+        cursor.execute('''CREATE TABLE IF NOT EXISTS stock_reservations
+                          (id INTEGER PRIMARY KEY, fuel_type_id INTEGER, employee_id INTEGER,
+                           liters REAL, created_at DATETIME, expires_at DATETIME)''')
+        cursor.execute('''CREATE INDEX IF NOT EXISTS idx_stock_reservations_expires_at
+                          ON stock_reservations (expires_at)''')
     
-    cursor.execute('''CREATE TABLE IF NOT EXISTS admins
-                      (id INTEGER PRIMARY KEY, username TEXT, password TEXT)''')
+        migrate_database()
     
-    # Insert example employees
-    cursor.execute("INSERT OR IGNORE INTO employees (id, name, password) VALUES (?, ?, ?)",
-                   (123456, "Pluto", hashlib.sha256("pluto_pass".encode()).hexdigest()))
-    cursor.execute("INSERT OR IGNORE INTO employees (id, name, password) VALUES (?, ?, ?)",
-                   (789012, "Mickey", hashlib.sha256("mickey_pass".encode()).hexdigest()))
-    cursor.execute("INSERT OR IGNORE INTO employees (id, name, password) VALUES (?, ?, ?)",
-                   (345678, "Donald", hashlib.sha256("donald_pass".encode()).hexdigest()))
+        # Insert example employees (hashed only when missing, the KDF is slow on purpose)
+        for employee_id, name, password in [(123456, "Pluto", "pluto_pass"),
+                                            (789012, "Mickey", "mickey_pass"),
+                                            (345678, "Donald", "donald_pass")]:
+            if not cursor.execute("SELECT 1 FROM employees WHERE id = ?", (employee_id,)).fetchone():
+                cursor.execute("INSERT INTO employees (id, name, password) VALUES (?, ?, ?)",
+                               (employee_id, name, hash_password(password)))
 
-    # Insert initial fuel types
-    cursor.execute("INSERT OR IGNORE INTO fuel_types (name, price, stock) VALUES (?, ?, ?)",
-                   ("Regular", 16.67, 10000))
-    cursor.execute("INSERT OR IGNORE INTO fuel_types (name, price, stock) VALUES (?, ?, ?)",
-                   ("Premium", 18.99, 10000))
-    cursor.execute("INSERT OR IGNORE INTO fuel_types (name, price, stock) VALUES (?, ?, ?)",
-                   ("Diesel", 17.50, 10000))
+        # Insert initial fuel types
+        cursor.execute("INSERT OR IGNORE INTO fuel_types (name, price_cents, stock_ml) VALUES (?, ?, ?)",
+                       ("Regular", 1667, 10000 * 1000))
+        cursor.execute("INSERT OR IGNORE INTO fuel_types (name, price_cents, stock_ml) VALUES (?, ?, ?)",
+                       ("Premium", 1899, 10000 * 1000))
+        cursor.execute("INSERT OR IGNORE INTO fuel_types (name, price_cents, stock_ml) VALUES (?, ?, ?)",
+                       ("Diesel", 1750, 10000 * 1000))
 
-    # Insert example admin
-    cursor.execute("INSERT OR IGNORE INTO admins (username, password) VALUES (?, ?)",
-                   ("admin", hashlib.sha256("admin_pass".encode()).hexdigest()))
+        # Insert example admin
+        if not cursor.execute("SELECT 1 FROM admins WHERE username = ?", ("admin",)).fetchone():
+            cursor.execute("INSERT INTO admins (username, password) VALUES (?, ?)",
+                           ("admin", hash_password("admin_pass")))
 
-    conn.commit()
-    conn.close()
+    # Sales acknowledged before a crash but not yet applied go in first,
+    # so their reservations are settled rather than expired
+    replay_sale_journal()
+    # Give back stock held by sessions that never finished (e.g. after a crash)
+    expire_reservations()
+    prune_change_events()
 
-def authenticate_user(employee_id, password):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT password FROM employees WHERE id = ?", (employee_id,))
-    result = cursor.fetchone()
-    
-    conn.close()
-    
-    if result and result[0] == hashlib.sha256(password.encode()).hexdigest():
+# Password hashing settings. PBKDF2 cost: raise it as far as login latency on
+# the terminal allows (see `python benchmark.py login`).
+PASSWORD_ITERATIONS = int(os.environ.get('FUEL_PASSWORD_ITERATIONS', 200_000))
+PASSWORD_SALT_BYTES = 16
+LOGIN_CACHE_TTL = 300  # seconds a successful login is remembered per terminal
+
+def hash_password(password, iterations=None):
+    # Stored as pbkdf2_sha256$<iterations>$<salt hex>$<hash hex>
+    iterations = iterations or PASSWORD_ITERATIONS
+    salt = os.urandom(PASSWORD_SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+def verify_password(password, stored):
+    # Returns (matches, needs_rehash). Rows from before salted hashes hold a
+    # bare SHA-256 hex digest; they verify once more and are then rehashed.
+    if '$' not in stored:
+        return hmac.compare_digest(stored, hashlib.sha256(password.encode()).hexdigest()), True
+    algorithm, iterations, salt, digest = stored.split('$')
+    if algorithm != 'pbkdf2_sha256':
+        return False, False
+    candidate = hashlib.pbkdf2_hmac('sha256', password.encode(), bytes.fromhex(salt), int(iterations))
+    return hmac.compare_digest(candidate.hex(), digest), int(iterations) != PASSWORD_ITERATIONS
+
+# Verified against when the account does not exist, so unknown ids cost the same as wrong passwords
+_DUMMY_PASSWORD_HASH = None
+
+class LoginCache:
+    # Remembers recent successful logins so repeat fuelings by the same
+    # attendant skip the database and the KDF. Holds a keyed HMAC of the
+    # password (key lives only in this process), never the password itself.
+    def __init__(self, ttl=LOGIN_CACHE_TTL):
+        self.ttl = ttl
+        self._key = os.urandom(32)
+        self._entries = {}  # (kind, account) -> (expires, token)
+        self._lock = Lock()
+
+    def _token(self, password):
+        return hmac.new(self._key, password.encode(), 'sha256').digest()
+
+    def check(self, kind, account, password):
+        with self._lock:
+            entry = self._entries.get((kind, str(account)))
+        if entry is None or entry[0] < time.monotonic():
+            return False
+        return hmac.compare_digest(entry[1], self._token(password))
+
+    def remember(self, kind, account, password):
+        with self._lock:
+            self._entries[(kind, str(account))] = (time.monotonic() + self.ttl, self._token(password))
+
+    def forget(self, kind=None, account=None):
+        with self._lock:
+            if kind is None:
+                self._entries.clear()
+            else:
+                self._entries.pop((kind, str(account)), None)
+
+login_cache = LoginCache()
+
+def _authenticate(kind, table, key_column, account, password):
+    global _DUMMY_PASSWORD_HASH
+    if login_cache.check(kind, account, password):
+        metrics.inc('logins_total', kind=kind, result='cached')
         return True
-    return False
+
+    with db_connection() as conn:
+        result = conn.execute(f"SELECT password FROM {table} WHERE {key_column} = ?", (account,)).fetchone()
+    if result is None:
+        _DUMMY_PASSWORD_HASH = _DUMMY_PASSWORD_HASH or hash_password('')
+        verify_password(password, _DUMMY_PASSWORD_HASH)
+        metrics.inc('logins_total', kind=kind, result='failed')
+        return False
+
+    with metrics.timer('password_verify_seconds'):
+        matches, needs_rehash = verify_password(password, result[0])
+    if not matches:
+        metrics.inc('logins_total', kind=kind, result='failed')
+        return False
+    if needs_rehash:
+        # Only replaces the hash that was just verified, in case it changed meanwhile
+        with db_connection() as conn:
+            conn.execute(f"UPDATE {table} SET password = ? WHERE {key_column} = ? AND password = ?",
+                         (hash_password(password), account, result[0]))
+    login_cache.remember(kind, account, password)
+    metrics.inc('logins_total', kind=kind, result='ok')
+    return True
+
+def authenticate_user(employee_id, password):
+    return _authenticate('employee', 'employees', 'id', employee_id, password)
 
 def authenticate_admin(username, password):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT password FROM admins WHERE username = ?", (username,))
-    result = cursor.fetchone()
-    
-    conn.close()
-    
-    if result and result[0] == hashlib.sha256(password.encode()).hexdigest():
-        return True
-    return False
+    return _authenticate('admin', 'admins', 'username', username, password)
 
 def load_fuel_prices():
     if os.path.exists(CONFIG_FILE):
@@ -107,44 +895,128 @@ def save_fuel_prices(prices):
     with open(CONFIG_FILE, 'w') as file:
         json.dump(prices, file, indent=4)
 
+# How often the scheduler looks at CONFIG_FILE; an unchanged file costs one stat()
+PRICE_POLL_SECONDS = 5
+
+# In-process copy of the fuel prices. refresh() only reads CONFIG_FILE when
+# its mtime/size changed and only writes when its content hash changed, and
+# then only the prices that actually differ, in one transaction. Subscribers
+# get {fuel name: Money} for every change ({name: None} if a fuel was removed).
+class PriceCache:
+    def __init__(self, config_file=CONFIG_FILE):
+        self.config_file = config_file
+        self._lock = Lock()
+        self._subscribers = []
+        self._reset()
+
+    def _reset(self):
+        self._database = DATABASE_NAME
+        self._file_key = None
+        self._file_hash = None
+        self._prices = None
+
+    def _load(self):
+        # Called with the lock held; starts over if DATABASE_NAME was repointed
+        if self._database != DATABASE_NAME:
+            self._reset()
+        if self._prices is None:
+            with db_connection() as conn:
+                self._prices = {name: Money(cents) for name, cents in
+                                conn.execute("SELECT name, price_cents FROM fuel_types")}
+        return self._prices
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def _notify(self, changes):
+        if changes:
+            for callback in list(self._subscribers):
+                callback(changes)
+
+    def prices(self):
+        with self._lock:
+            return dict(self._load())
+
+    def reload(self):
+        # Re-reads the database after prices were edited directly (manage_fuel_types)
+        with self._lock:
+            old = dict(self._load())
+            self._prices = None
+            new = self._load()
+        changes = {name: price for name, price in new.items() if old.get(name) != price}
+        changes.update({name: None for name in old if name not in new})
+        self._notify(changes)
+        return changes
+
+    def refresh(self):
+        try:
+            stat = os.stat(self.config_file)
+        except FileNotFoundError:
+            return {}
+        file_key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            prices = self._load()
+            if file_key == self._file_key:
+                return {}
+            with open(self.config_file, 'rb') as file:
+                data = file.read()
+            file_hash = hashlib.sha256(data).hexdigest()
+            if file_hash == self._file_hash:
+                self._file_key = file_key
+                return {}
+            wanted = {name: Money.parse(price) for name, price in json.loads(data).items()}
+            self._file_key, self._file_hash = file_key, file_hash
+
+            changes = {name: price for name, price in wanted.items() if name in prices and prices[name] != price}
+            if changes:
+                with write_transaction() as conn:
+                    conn.executemany("UPDATE fuel_types SET price_cents = ? WHERE name = ?",
+                                     [(price, name) for name, price in changes.items()])
+                prices.update(changes)
+        self._notify(changes)
+        return changes
+
+price_cache = PriceCache()
+
 def  update_fuel_prices():
-    prices = load_fuel_prices()
-    
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+    metrics.inc('price_polls_total')
+    try:
+        changes = price_cache.refresh()
+    except (sqlite3.Error, ValueError, ArithmeticError) as error:
+        metrics.inc('price_poll_errors_total')
+        print(f"Fuel price update failed: {error}")
+        return None
     
-    for fuel_type, price in prices.items():
-        cursor.execute("UPDATE fuel_types SET price = ? WHERE name = ?", (price, fuel_type))
-    
-    conn.commit()
-    conn.close()
-    print("Fuel prices updated successfully.")
-
-    # Call this function at program startup
-    #update_fuel_prices()
+    if changes:
+        metrics.inc('price_changes_total', len(changes))
+        print("Fuel prices updated: " + ", ".join(f"{name} R{price}" for name, price in changes.items()))
+    return changes
 
 def run_price_update_scheduler():
-    schedule.every(1).hour.do(update_fuel_prices)
+    schedule.every(PRICE_POLL_SECONDS).seconds.do(update_fuel_prices)
     
     while True:
         schedule.run_pending()
-        time.sleep(60)
+        time.sleep(1)
 
-# Start the automatic price update scheduler in a separate thread
-price_update_thread = Thread(target=run_price_update_scheduler)
-price_update_thread.daemon = True
-price_update_thread.start()
+price_update_thread = None
+
+def start_price_update_scheduler():
+    # Started on request (the GUI entry point), not at import time
+    global price_update_thread
+    if price_update_thread is None:
+        price_update_thread = Thread(target=run_price_update_scheduler)
+        price_update_thread.daemon = True
+        price_update_thread.start()
+    return price_update_thread
 
-            
 def get_fuel_types():
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT name, price FROM fuel_types")
-    fuel_types = {row[0]: Decimal(str(row[1])) for row in cursor.fetchall()}
-    
-    conn.close()
-    return fuel_types
+    return price_cache.prices()
 
 def create_advanced_ui():
     sg.theme('DarkBlue13')
@@ -165,17 +1037,106 @@ def create_advanced_ui():
     
     return sg.Window(COMPANY_NAME, layout, finalize=True, element_justification='center', font=('Helvetica', 12), size=(600, 500), return_keyboard_events=True)
 
+# Chart rendering settings
+CHART_CACHE_SIZE = 32  # rendered charts kept, least recently used dropped first
+
+def _bar_chart(figure, title, xlabel, ylabel, labels, values):
+    ax = figure.subplots()
+    ax.bar(labels, values)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.tick_params(axis='x', labelrotation=45)
+    figure.tight_layout()
+
+def _pie_chart(figure, title, labels, values):
+    ax = figure.subplots()
+    ax.pie(values, labels=labels, autopct='%1.1f%%', startangle=90)
+    ax.axis('equal')
+    ax.set_title(title)
+
+CHART_TYPES = {'bar': _bar_chart, 'pie': _pie_chart}
+
+class ChartService:
+    # Renders charts to PNG bytes on one worker thread. Figures are built with
+    # matplotlib.figure.Figure directly (Agg canvas, no pyplot), so nothing
+    # keeps them alive once rendered. Results are cached by a hash of the
+    # chart type and data; identical requests share one render.
+    def __init__(self, cache_size=CHART_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # key -> Future of PNG bytes
+        self._lock = Lock()
+        self._executor = None
+
+    def submit(self, kind, *args, figsize=(10, 6)):
+        key = hashlib.sha256(json.dumps([kind, figsize, args], default=str).encode()).hexdigest()
+        with self._lock:
+            future = self._cache.get(key)
+            if future is not None:
+                self._cache.move_to_end(key)
+                metrics.inc('chart_requests_total', cache='hit')
+                return future
+            metrics.inc('chart_requests_total', cache='miss')
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='charts')
+            future = self._executor.submit(self._render, kind, args, figsize)
+            self._cache[key] = future
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        future.add_done_callback(lambda done: done.exception() and self._forget(key, done))
+        return future
+
+    def render(self, kind, *args, **kwargs):
+        return self.submit(kind, *args, **kwargs).result()
+
+    def _forget(self, key, future):
+        # Failed renders are not cached
+        with self._lock:
+            if self._cache.get(key) is future:
+                del self._cache[key]
+
+    def _render(self, kind, args, figsize):
+        with metrics.timer('chart_render_seconds', kind=kind):
+            figure = mpl_figure.Figure(figsize=figsize)
+            try:
+                CHART_TYPES[kind](figure, *args)
+                buf = BytesIO()
+                figure.savefig(buf, format="png")
+                return buf.getvalue()
+            finally:
+                figure.clear()
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+chart_service = ChartService()
+
+def post_chart(window, event, future):
+    # Hands a rendered chart to the window's event loop as `event`; None if rendering failed
+    future.add_done_callback(lambda done: window.write_event_value(
+        event, None if done.exception() else done.result()))
+
+def show_chart(title, png):
+    if png is None:
+        sg.popup_error("The graph could not be rendered.")
+        return
+    window = sg.Window(title, [[sg.Image(data=png)]])
+    window.read(close=True)
+
+@metrics.timed('report_seconds', report='sales_by_fuel')
+def get_sales_by_fuel():
+    with db_connection() as conn:
+        return conn.execute("""
+            SELECT ft.name, r.total_cents / 100.0 as total_sales, r.total_ml / 1000.0 as total_liters
+            FROM sales_by_fuel r
+            JOIN fuel_types ft ON r.fuel_type_id = ft.id
+            ORDER BY ft.name
+        """).fetchall()
+
 def view_reports():
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT ft.name, SUM(t.amount) as total_sales, SUM(t.liters) as total_liters
-        FROM transactions t
-        JOIN fuel_types ft ON t.fuel_type_id = ft.id
-        GROUP BY ft.name
-    """)
-    sales_data = cursor.fetchall()
+    sales_data = get_sales_by_fuel()
     
     layout = [
         [sg.Text("Sales Report", font=('Helvetica', 20))],
@@ -195,29 +1156,16 @@ def view_reports():
         if event in (sg.WINDOW_CLOSED, 'Close'):
             break
         elif event == "Generate Graph":
-            generate_sales_graph(sales_data)
+            post_chart(window, '-GRAPH-', generate_sales_graph(sales_data))
+        elif event == '-GRAPH-':
+            show_chart("Sales Graph", values['-GRAPH-'])
     
     window.close()
-    conn.close()
 
 def generate_sales_graph(sales_data):
     fuel_types = [row[0] for row in sales_data]
     sales = [row[1] for row in sales_data]
-    
-    plt.figure(figsize=(10, 6))
-    plt.bar(fuel_types, sales)
-    plt.title('Sales by Fuel Type')
-    plt.xlabel('Fuel Type')
-    plt.ylabel('Total Sales')
-    plt.xticks(rotation=45)
-    
-    buf = BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    
-    layout = [[sg.Image(data=buf.getvalue())]]
-    window = sg.Window("Sales Graph", layout)
-    window.read(close=True)
+    return chart_service.submit('bar', 'Sales by Fuel Type', 'Fuel Type', 'Total Sales', fuel_types, sales)
 
 def create_admin_ui():
     sg.theme('DarkBlue13')
@@ -231,119 +1179,1393 @@ def create_admin_ui():
     
     return sg.Window('Admin Panel', layout, finalize=True, element_justification='center', font=('Helvetica', 12), size=(500, 300))
 
+# Pump simulation settings
+PUMP_FLOW_RATE_ML = 500  # milliliters per second
+PUMP_TICK_MS = 100  # milliseconds per pump loop
+
+# Stock reservation settings
+RESERVATION_TTL = datetime.timedelta(minutes=15)
+RESERVATION_SWEEP_INTERVAL = 30  # seconds between expiry sweeps on the sale path
+
+def reserve_stock(conn, fuel_type_id, employee_id, ml):
+    # Conditional decrement: succeeds only if the tank still holds enough
+    cursor = conn.execute("UPDATE fuel_types SET stock_ml = stock_ml - ? WHERE id = ? AND stock_ml >= ?",
+                          (ml, fuel_type_id, ml))
+    if cursor.rowcount == 0:
+        return None
+    now = datetime.datetime.now()
+    cursor = conn.execute('''INSERT INTO stock_reservations (fuel_type_id, employee_id, ml, created_at, expires_at)
+                             VALUES (?, ?, ?, ?, ?)''',
+                          (fuel_type_id, employee_id, ml, now, now + RESERVATION_TTL))
+    return cursor.lastrowid
+
+def release_reservation(conn, reservation_id, used_ml=0):
+    # Drops the hold and returns the unused part of it to the tank.
+    # Returns False if the hold had already expired (its stock was given back).
+    row = conn.execute("SELECT fuel_type_id, ml FROM stock_reservations WHERE id = ?",
+                       (reservation_id,)).fetchone()
+    if row is None:
+        return False
+    fuel_type_id, ml = row
+    conn.execute("DELETE FROM stock_reservations WHERE id = ?", (reservation_id,))
+    if ml - used_ml:
+        conn.execute("UPDATE fuel_types SET stock_ml = stock_ml + ? WHERE id = ?", (ml - used_ml, fuel_type_id))
+    return True
+
+def expire_reservations(now=None):
+    now = now or datetime.datetime.now()
+    with write_transaction() as conn:
+        expired = conn.execute("SELECT fuel_type_id, SUM(ml) FROM stock_reservations WHERE expires_at < ? GROUP BY fuel_type_id",
+                               (now,)).fetchall()
+        if not expired:
+            return 0
+        conn.executemany("UPDATE fuel_types SET stock_ml = stock_ml + ? WHERE id = ?",
+                         [(ml, fuel_type_id) for fuel_type_id, ml in expired])
+        cursor = conn.execute("DELETE FROM stock_reservations WHERE expires_at < ?", (now,))
+        return cursor.rowcount
+
+# A sale that has been started but not yet committed. Everything is integer
+# cents and milliliters, so a pump tick is a couple of int operations.
+# Stock forecast settings
+FORECAST_WINDOW_HOURS = 24  # time constant of the depletion rate
+LOW_STOCK_HOURS = 12  # alert when a tank is projected to run dry sooner than this
+LOW_STOCK_ML = 500 * 1000  # ...or holds less than this, whatever the rate
+LOW_STOCK_REARM = 1.5  # alert again only after recovering past the thresholds times this
+FORECAST_HORIZON_HOURS = 10 * 365 * 24  # no empty-at date beyond this
+
+# Depletion rate per fuel as an exponentially decayed sum of pumped ml: each
+# sale adds its ml and the sum decays with time constant FORECAST_WINDOW_HOURS,
+# so sum / window is a rolling ml-per-hour rate. A sale costs O(1); only the
+# start-up seeding reads history, and then only the hourly rollup. Subscribers
+# get a list of forecast dicts when a fuel crosses into low stock.
+class StockForecast:
+    def __init__(self, window_hours=FORECAST_WINDOW_HOURS):
+        self.window = window_hours * 3600
+        self._lock = Lock()
+        self._subscribers = []
+        self._reset()
+
+    def _reset(self):
+        self._database = DATABASE_NAME
+        self._decayed = None  # fuel_type_id -> (decayed ml, as of epoch seconds)
+        self._alerted = set()
+
+    def _load(self, now):
+        # Called with the lock held; starts over if DATABASE_NAME was repointed
+        if self._database != DATABASE_NAME:
+            self._reset()
+        if self._decayed is None:
+            since = datetime.datetime.fromtimestamp(now - 5 * self.window)
+            self._decayed = {}
+            with db_connection() as conn:
+                rows = conn.execute("SELECT hour, fuel_type_id, total_ml FROM sales_by_hour WHERE hour >= ?",
+                                    (since.strftime('%Y-%m-%dT%H'),)).fetchall()
+            for hour, fuel_type_id, ml in rows:
+                sold_at = min(datetime.datetime.fromisoformat(hour + ':30').timestamp(), now)
+                self._add(fuel_type_id, ml * math.exp((sold_at - now) / self.window), now)
+        return self._decayed
+
+    def _decayed_ml(self, fuel_type_id, now):
+        ml, at = self._decayed.get(fuel_type_id, (0.0, now))
+        return ml * math.exp((at - now) / self.window)
+
+    def _add(self, fuel_type_id, ml, now):
+        self._decayed[fuel_type_id] = (self._decayed_ml(fuel_type_id, now) + ml, now)
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def record_sales(self, sales, now=None):
+        now = now or time.time()
+        with self._lock:
+            self._load(now)
+            for sale in sales:
+                self._add(sale.fuel_type_id, sale.pumped_ml, now)
+        return self.check({sale.fuel_type_id for sale in sales}, now)
+
+    def rate(self, fuel_type_id, now=None):
+        # Milliliters per hour
+        now = now or time.time()
+        with self._lock:
+            self._load(now)
+            return self._decayed_ml(fuel_type_id, now) / self.window * 3600
+
+    def forecast(self, fuel_type_ids=None, now=None):
+        now = now or time.time()
+        with db_connection() as conn:
+            if fuel_type_ids is None:
+                rows = conn.execute("SELECT id, name, stock_ml FROM fuel_types ORDER BY name").fetchall()
+            else:
+                ids = sorted(fuel_type_ids)
+                rows = conn.execute(f"SELECT id, name, stock_ml FROM fuel_types WHERE id IN ({', '.join('?' * len(ids))})",
+                                    ids).fetchall()
+        result = []
+        for fuel_type_id, name, stock_ml in rows:
+            rate = self.rate(fuel_type_id, now)
+            hours_left = stock_ml / rate if rate > 0 else None
+            result.append({'fuel_type_id': fuel_type_id, 'name': name, 'stock_ml': stock_ml,
+                           'rate_ml_per_hour': rate, 'hours_left': hours_left,
+                           'empty_at': (datetime.datetime.fromtimestamp(now + hours_left * 3600)
+                                        if hours_left is not None and hours_left < FORECAST_HORIZON_HOURS else None),
+                           'low': stock_ml < LOW_STOCK_ML or (hours_left is not None and hours_left < LOW_STOCK_HOURS)})
+        return result
+
+    def check(self, fuel_type_ids=None, now=None):
+        # Notifies once per fuel as it turns low; re-arms when it is well stocked again
+        alerts = []
+        for forecast in self.forecast(fuel_type_ids, now):
+            fuel_type_id = forecast['fuel_type_id']
+            with self._lock:
+                if forecast['low'] and fuel_type_id not in self._alerted:
+                    self._alerted.add(fuel_type_id)
+                    alerts.append(forecast)
+                elif (fuel_type_id in self._alerted and forecast['stock_ml'] > LOW_STOCK_ML * LOW_STOCK_REARM
+                      and (forecast['hours_left'] is None or forecast['hours_left'] > LOW_STOCK_HOURS * LOW_STOCK_REARM)):
+                    self._alerted.discard(fuel_type_id)
+        if alerts:
+            for callback in list(self._subscribers):
+                callback(alerts)
+        return alerts
+
+stock_forecast = StockForecast()
+
+def format_low_stock_alert(alert):
+    left = f", empty in about {alert['hours_left']:.1f} h" if alert['hours_left'] is not None else ""
+    return f"Low stock: {alert['name']} has {Volume(alert['stock_ml'])} L left{left}"
+
+def print_low_stock_alerts(alerts):
+    # Headless runs (CLI, simulations) get the alerts on stdout; the
+    # attendant and admin windows also show them, see show_low_stock_alerts()
+    for alert in alerts:
+        print(format_low_stock_alert(alert))
+
+stock_forecast.subscribe(print_low_stock_alerts)
+
+def subscribe_low_stock_alerts(window):
+    # Alerts arrive on whichever thread committed the sale; hand them to the
+    # GUI loop. Tanks that are already low show up as soon as the window opens.
+    low = [forecast for forecast in stock_forecast.forecast() if forecast['low']]
+    if low:
+        window.write_event_value('-LOW_STOCK-', low)
+    return stock_forecast.subscribe(lambda alerts: window.write_event_value('-LOW_STOCK-', alerts))
+
+def show_low_stock_alerts(alerts):
+    sg.popup_no_wait("\n".join(format_low_stock_alert(alert) for alert in alerts), title="Low stock",
+                     background_color='#DC3545', keep_on_top=True)
+
+class FuelSale:
+    __slots__ = ('employee_id', 'employee_name', 'fuel_type', 'fuel_type_id', 'price', 'prepaid', 'target_ml',
+                 'pumped_ml', 'reservation_id', 'transaction_id', 'completed_at', 'invoice')
+
+    def __init__(self, employee_id, fuel_type, fuel_type_id, price, prepaid):
+        self.employee_id = employee_id
+        self.fuel_type = fuel_type
+        self.fuel_type_id = fuel_type_id
+        self.price = price  # Money per liter
+        self.prepaid = prepaid
+        # Round down: never pour more than was paid for
+        self.target_ml = prepaid * 1000 // price
+        self.pumped_ml = 0
+        self.reservation_id = None
+        self.transaction_id = None
+        self.employee_name = None
+        self.completed_at = None
+        self.invoice = None
+
+    @property
+    def amount(self):
+        if self.pumped_ml == self.target_ml:
+            return self.prepaid
+        return Money((self.pumped_ml * self.price + 500) // 1000)
+
+    @property
+    def liters(self):
+        return Volume(self.pumped_ml)
+
+    @property
+    def progress(self):
+        return self.pumped_ml * 100 // self.target_ml if self.target_ml else 100
+
+    @property
+    def done(self):
+        return self.pumped_ml >= self.target_ml
+
+# Headless sale path: start_sale -> dispense -> complete_sale -> invoice.
+# Nothing in here touches the GUI, so it can be driven from the pump window,
+# a script or a load generator alike.
+class TransactionEngine:
+    def __init__(self):
+        self._last_sweep = 0.0
+        self._last_prune = time.monotonic()  # setup_database() has just pruned
+        self._database = None
+        self._employee_names = {}  # id -> name, for receipts
+        self.journal = None  # SaleJournal, see open_sale_journal()
+
+    def _fuel_type(self, conn, name):
+        # Read inside the sale's BEGIN IMMEDIATE, not cached: prices can be
+        # changed by other processes (imports, another admin terminal, sync)
+        # and the sale must be charged at the price the row has as it reserves
+        row = conn.execute("SELECT id, price_cents FROM fuel_types WHERE name = ?", (name,)).fetchone()
+        return (row[0], Money(row[1])) if row else None
+
+    def _employee_name(self, conn, employee_id):
+        if self._database != DATABASE_NAME:
+            self._database = DATABASE_NAME
+            self._employee_names = {}
+        name = self._employee_names.get(employee_id)
+        if name is None:
+            row = conn.execute("SELECT name FROM employees WHERE id = ?", (employee_id,)).fetchone()
+            name = row[0] if row else None
+            if name is not None:
+                self._employee_names[employee_id] = name
+        return name
+
+    def forget_employee(self, employee_id):
+        self._employee_names.pop(employee_id, None)
+
+    def start_sale(self, employee_id, fuel_type, amount):
+        try:
+            amount = Money.parse(amount)
+        except (ArithmeticError, ValueError):
+            return None, "Invalid amount entered."
+        if amount <= 0:
+            return None, "Invalid amount entered."
+
+        if time.monotonic() - self._last_sweep > RESERVATION_SWEEP_INTERVAL:
+            self._last_sweep = time.monotonic()
+            expire_reservations()
+        # Every sale adds change events; a terminal that stays up for weeks
+        # would otherwise only drop them at the next start
+        if time.monotonic() - self._last_prune > CHANGE_FEED_PRUNE_INTERVAL:
+            self._last_prune = time.monotonic()
+            prune_change_events()
+
+        with metrics.timer('sale_stage_seconds', stage='reserve'), write_transaction() as conn:
+            fuel = self._fuel_type(conn, fuel_type)
+            if fuel is None:
+                metrics.inc('sale_errors_total', reason='unknown_fuel')
+                return None, f"Unknown fuel type: {fuel_type}"
+            sale = FuelSale(employee_id, fuel_type, fuel[0], fuel[1], amount)
+            sale.employee_name = self._employee_name(conn, employee_id)
+
+            sale.reservation_id = reserve_stock(conn, sale.fuel_type_id, employee_id, sale.target_ml)
+            if sale.reservation_id is None:
+                metrics.inc('sale_errors_total', reason='insufficient_stock')
+                return None, "Insufficient fuel stock"
+
+        return sale, None
+
+    def dispense(self, sale, ml):
+        sale.pumped_ml = min(sale.pumped_ml + ml, sale.target_ml)
+        return sale.pumped_ml
+
+    def _settle_stock(self, conn, sale):
+        if not release_reservation(conn, sale.reservation_id, sale.pumped_ml):
+            # The hold expired mid-sale and went back to the tank; the fuel is
+            # gone all the same, so take what was pumped off the stock now
+            conn.execute("UPDATE fuel_types SET stock_ml = stock_ml - ? WHERE id = ?",
+                         (sale.pumped_ml, sale.fuel_type_id))
+
+    def _record_sale(self, conn, sale):
+        amount = sale.amount
+        self._settle_stock(conn, sale)
+
+        now = sale.completed_at = datetime.datetime.now()
+        cursor = conn.execute('''INSERT INTO transactions (employee_id, fuel_type_id, amount_cents, liters_ml, timestamp)
+                                 VALUES (?, ?, ?, ?, ?)''',
+                              (sale.employee_id, sale.fuel_type_id, amount, sale.pumped_ml, now))
+        sale.transaction_id = cursor.lastrowid
+        update_sales_rollups(conn, sale.employee_id, sale.fuel_type_id, amount, sale.pumped_ml, now)
+        sale.invoice = render_invoice(sale.employee_name, sale.fuel_type, amount, sale.liters, now)
+        archive_receipts(conn, [(sale.transaction_id, sale.invoice)])
+
+    def complete_sale(self, sale):
+        return self.complete_sales([sale])[0]
+
+    def complete_sales(self, sales):
+        # Commits many finished sales in one go: one transaction, or with a
+        # sale journal open, one durable journal append
+        if self.journal is not None:
+            with metrics.timer('sale_stage_seconds', stage='journal'):
+                self.journal.record_sales(sales)
+        else:
+            with metrics.timer('sale_stage_seconds', stage='record'), write_transaction() as conn:
+                for sale in sales:
+                    self._record_sale(conn, sale)
+        metrics.inc('sales_total', len(sales))
+        metrics.inc('sales_cents_total', sum(sale.amount for sale in sales))
+        with metrics.timer('sale_stage_seconds', stage='forecast'):
+            stock_forecast.record_sales(sales)
+
+        with metrics.timer('sale_stage_seconds', stage='invoice'):
+            for sale in sales:
+                if sale.invoice is None:  # journaled: archived when the journal is applied
+                    sale.invoice = render_invoice(sale.employee_name, sale.fuel_type, sale.amount,
+                                                  sale.liters, sale.completed_at)
+        return [sale.invoice for sale in sales]
+
+    def cancel_sale(self, sale):
+        with write_transaction() as conn:
+            release_reservation(conn, sale.reservation_id)
+
+    def write_off_sale(self, sale):
+        # The sale could not be recorded but its fuel was pumped: settle the
+        # hold with the pumped ml off the stock rather than let it expire
+        with write_transaction() as conn:
+            self._settle_stock(conn, sale)
+
+    def sell(self, employee_id, fuel_type, amount, liters=None):
+        # Runs a whole sale in one call, dispensing `liters` (or the full amount)
+        sale, error = self.start_sale(employee_id, fuel_type, amount)
+        if error:
+            return None, error
+        self.dispense(sale, sale.target_ml if liters is None else Volume.parse(liters))
+        return self.complete_sale(sale), None
+
+# Sale journal settings
+SALE_JOURNAL_FILE = 'sale_journal.jsonl'  # next to DATABASE_NAME, prefixed with its name
+JOURNAL_APPLY_BATCH = 5000  # records per database transaction
+JOURNAL_APPLY_INTERVAL_MS = 100
+JOURNAL_COMPACT_BYTES = 16 * 1024 * 1024  # truncate once fully applied and this big
+
+# Applies journal records as three executemany passes. The stock update covers
+# both cases of release_reservation: with the hold still there the unpumped
+# remainder goes back, with the hold expired only the pumped liters come off.
+JOURNAL_APPLY_STATEMENTS = [
+    '''UPDATE fuel_types
+       SET stock_ml = stock_ml + COALESCE((SELECT ml FROM stock_reservations WHERE id = :reservation_id), 0)
+                      - :liters_ml
+       WHERE id = :fuel_type_id''',
+    "DELETE FROM stock_reservations WHERE id = :reservation_id",
+    '''INSERT INTO transactions (employee_id, fuel_type_id, amount_cents, liters_ml, timestamp)
+       VALUES (:employee_id, :fuel_type_id, :amount_cents, :liters_ml, :timestamp)''',
+] + SALES_ROLLUP_UPSERTS
+
+def apply_journal_records(records):
+    # Idempotent: records at or below the stored applied_seq are skipped
+    with write_transaction() as conn:
+        applied_seq = conn.execute("SELECT applied_seq FROM sale_journal_state WHERE id = 1").fetchone()[0]
+        records = [record for record in records if record['seq'] > applied_seq]
+        if not records:
+            return applied_seq
+        # Rowids are handed out as max + 1, so the batch gets consecutive ids from here
+        first_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM transactions").fetchone()[0]
+        for sql in JOURNAL_APPLY_STATEMENTS:
+            conn.executemany(sql, records)
+        archive_receipts(conn, [
+            (first_id + i, render_invoice(record.get('employee_name'), record.get('fuel_type'),
+                                          Money(record['amount_cents']), Volume(record['liters_ml']),
+                                          datetime.datetime.fromisoformat(record['timestamp'])))
+            for i, record in enumerate(records)])
+        applied_seq = records[-1]['seq']
+        conn.execute("UPDATE sale_journal_state SET applied_seq = ? WHERE id = 1", (applied_seq,))
+    return applied_seq
+
+def sale_journal_path():
+    # e.g. fuel_system.db -> fuel_system.sale_journal.jsonl, so every database has its own journal
+    return f"{os.path.splitext(os.path.abspath(DATABASE_NAME))[0]}.{SALE_JOURNAL_FILE}"
+
+def get_database_id():
+    with db_connection() as conn:
+        return conn.execute("SELECT database_id FROM sale_journal_state WHERE id = 1").fetchone()[0]
+
+def read_sale_journal(path=None):
+    # The first line names the database the journal belongs to; records for
+    # any other database would apply to the wrong fuel types and employees
+    path = path or sale_journal_path()
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, 'r') as file:
+        header = file.readline()
+        if not header.endswith('\n'):
+            return []  # empty, or torn while being created
+        if json.loads(header).get('database_id') != get_database_id():
+            raise RuntimeError(f"{path} was not written by {DATABASE_NAME}; move it away to continue")
+        for line in file:
+            if not line.endswith('\n'):
+                break  # torn final write from a crash; it was never acknowledged
+            records.append(json.loads(line))
+    return records
+
+def replay_sale_journal(path=None):
+    records = read_sale_journal(path)
+    for start in range(0, len(records), JOURNAL_APPLY_BATCH):
+        apply_journal_records(records[start:start + JOURNAL_APPLY_BATCH])
+    return len(records)
+
+# Append-only, group-committed log of finished sales. record_sales() returns
+# once its records are fsynced: whatever queued up while the previous fsync
+# ran goes out in the next single write + fsync, so under load one fsync
+# covers many sales. A background thread applies durable records to the
+# database in JOURNAL_APPLY_BATCH chunks; replay_sale_journal() redoes any
+# that were acknowledged but not applied when the process died.
+class SaleJournal:
+    def __init__(self, path=None):
+        self.path = path or sale_journal_path()
+        self._cond = Condition()
+        self._pending = []  # records waiting for the next group commit
+        self._writing = False  # a group is being written and fsynced
+        self._durable = []  # fsynced but not yet applied
+        self._durable_seq = 0
+        self._error = None  # why the writer stopped, if it failed
+        self._running = True
+
+        with db_connection() as conn:
+            applied_seq, self.database_id = conn.execute(
+                "SELECT applied_seq, database_id FROM sale_journal_state WHERE id = 1").fetchone()
+        on_disk = read_sale_journal(self.path)
+        self._next_seq = max([applied_seq] + [record['seq'] for record in on_disk]) + 1
+        self._durable_seq = self._next_seq - 1
+        # Unbuffered: a failed write must not leave bytes behind to go out later
+        self._file = open(self.path, 'ab', buffering=0)
+        if not on_disk:
+            self._start_file()
+
+        self._writer = Thread(target=self._write_loop, daemon=True)
+        self._applier = Thread(target=self._apply_loop, daemon=True)
+        self._writer.start()
+        self._applier.start()
+
+    def record_sales(self, sales):
+        completed_at = datetime.datetime.now()
+        now = adapt_datetime(completed_at)
+        with self._cond:
+            if self._error is not None:
+                raise RuntimeError(f"Sale journal write failed: {self._error}")
+            if not self._running:
+                raise RuntimeError("Sale journal is closed")
+            for sale in sales:
+                sale.completed_at = completed_at
+                self._pending.append({'seq': self._next_seq, 'employee_id': sale.employee_id,
+                                      'fuel_type_id': sale.fuel_type_id, 'reservation_id': sale.reservation_id,
+                                      'amount_cents': int(sale.amount), 'liters_ml': sale.pumped_ml,
+                                      'timestamp': now, 'employee_name': sale.employee_name,
+                                      'fuel_type': sale.fuel_type})
+                self._next_seq += 1
+            seq = self._next_seq - 1
+            self._cond.notify_all()
+            while self._durable_seq < seq:
+                if self._error is not None:
+                    raise RuntimeError(f"Sale journal write failed: {self._error}")
+                self._cond.wait()
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and self._running:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                group, self._pending = self._pending, []
+                self._writing = True
+            position = self._file.tell()
+            try:
+                with metrics.timer('journal_fsync_seconds'):
+                    self._write(''.join(json.dumps(record) + '\n' for record in group))
+            except OSError as error:
+                # Disk full, I/O error: none of the group is acknowledged, so
+                # none of it may be replayed later either. Fail every waiting
+                # and later sale instead of leaving them blocked.
+                try:
+                    self._file.truncate(position)
+                except OSError:
+                    pass
+                metrics.inc('journal_write_errors_total')
+                with self._cond:
+                    self._writing = False
+                    self._error = error
+                    self._pending = []
+                    self._cond.notify_all()
+                return
+            metrics.inc('journal_groups_total')
+            metrics.inc('journal_records_total', len(group))
+            with self._cond:
+                self._writing = False
+                self._durable.extend(group)
+                self._durable_seq = group[-1]['seq']
+                self._cond.notify_all()
+
+    def _apply_loop(self):
+        while self._running:
+            time.sleep(JOURNAL_APPLY_INTERVAL_MS / 1000)
+            self.apply_pending()
+
+    def apply_pending(self):
+        with self._cond:
+            batch = self._durable[:JOURNAL_APPLY_BATCH]
+        if not batch:
+            return 0
+        apply_journal_records(batch)
+        with self._cond:
+            del self._durable[:len(batch)]
+            compact = self._idle() and self._file.tell() > JOURNAL_COMPACT_BYTES
+        if compact:
+            self._compact()
+        return len(batch)
+
+    def _idle(self):
+        # Nothing queued, being written or waiting to be applied; call under _cond
+        return not self._pending and not self._writing and not self._durable
+
+    def _start_file(self):
+        self._file.truncate(0)
+        self._file.seek(0)
+        self._write(json.dumps({'database_id': self.database_id}) + '\n')
+
+    def _write(self, text):
+        data = memoryview(text.encode())
+        while data:
+            data = data[self._file.write(data):]
+        os.fsync(self._file.fileno())
+
+    def _compact(self):
+        # Everything written is applied, so the file can start over - once the
+        # applied sales are durable. With synchronous=NORMAL the last WAL
+        # commits can still roll back on power loss; a complete checkpoint
+        # syncs them into the database file.
+        with db_connection() as conn:
+            busy, wal_frames, checkpointed = conn.execute("PRAGMA wal_checkpoint(FULL)").fetchone()
+        if busy or checkpointed < wal_frames:
+            return  # held back by a reader; tried again after the next batch
+        with self._cond:
+            if self._idle():
+                self._start_file()
+
+    def flush(self):
+        # Waits until every sale acknowledged so far is in the database
+        while True:
+            with self._cond:
+                if not self._pending and not self._durable:
+                    return
+            time.sleep(JOURNAL_APPLY_INTERVAL_MS / 1000)
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._writer.join()
+        self._applier.join()
+        while self.apply_pending():
+            pass
+        self._file.close()
+
+def open_sale_journal(path=None, engine=None):
+    engine = engine or transaction_engine
+    replay_sale_journal(path)
+    engine.journal = SaleJournal(path)
+    return engine.journal
+
+def close_sale_journal(engine=None):
+    engine = engine or transaction_engine
+    if engine.journal is not None:
+        engine.journal.close()
+        engine.journal = None
+
+# Change feed settings
+CHANGE_FEED_POLL_MS = 250  # how often subscribers are checked for new events
+CHANGE_FEED_BATCH = 1000  # events per read / callback at most
+CHANGE_FEED_RETENTION = datetime.timedelta(days=7)  # pruned at start-up and then hourly
+CHANGE_FEED_PRUNE_INTERVAL = 3600  # seconds between prunes on the sale path
+
+CHANGE_EVENT_SELECT = '''
+    SELECT e.id, e.kind, e.fuel_type_id, e.ref_id, e.value, e.created_at, t.employee_id, t.liters_ml
+    FROM change_events e
+    LEFT JOIN transactions t ON e.kind = 'sale' AND t.id = e.ref_id
+    WHERE e.id > ? ORDER BY e.id LIMIT ?'''
+
+def _change_event(row):
+    event_id, kind, fuel_type_id, ref_id, value, created_at, employee_id, liters_ml = row
+    event = {'id': event_id, 'kind': kind, 'fuel_type_id': fuel_type_id, 'at': created_at}
+    if kind == 'sale':
+        event.update(transaction_id=ref_id, employee_id=employee_id, amount_cents=value, liters_ml=liters_ml)
+    elif kind == 'price':
+        event['price_cents'] = value
+    elif kind == 'stock':
+        event['stock_ml'] = value  # available stock, i.e. net of running pumps' holds
+    return event
+
+def read_change_events(cursor=0, limit=CHANGE_FEED_BATCH):
+    # Events after `cursor` in commit order; the last event's id is the next cursor
+    with db_connection() as conn:
+        return [_change_event(row) for row in conn.execute(CHANGE_EVENT_SELECT, (cursor, limit))]
+
+def get_change_cursor(name):
+    with db_connection() as conn:
+        row = conn.execute("SELECT last_id FROM change_feed_cursors WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+def save_change_cursor(name, last_id):
+    with db_connection() as conn:
+        conn.execute('''INSERT INTO change_feed_cursors (name, last_id, updated_at) VALUES (?, ?, ?)
+                        ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id, updated_at = excluded.updated_at''',
+                     (name, last_id, datetime.datetime.now()))
+
+def prune_change_events(retention=CHANGE_FEED_RETENTION):
+    # Ids follow commit order, so everything below the first recent id goes
+    cutoff = adapt_datetime(datetime.datetime.now() - retention)
+    with write_transaction() as conn:
+        # First recent id by walking ids upwards: after the first prune that
+        # is only the last interval's events, not a scan of the whole table.
+        # The newest event always stays, or ids would start over below the
+        # consumers' cursors.
+        cursor = conn.execute('''DELETE FROM change_events WHERE id < COALESCE(
+                                     (SELECT id FROM change_events WHERE created_at >= ? ORDER BY id LIMIT 1),
+                                     (SELECT MAX(id) FROM change_events))''', (cutoff,))
+        return cursor.rowcount
+
+# Local subscriptions to the change feed. Each subscriber has its own cursor
+# and gets lists of event dicts, in commit order, from a polling thread that
+# only runs while someone is subscribed. A subscriber registered under a name
+# has its cursor saved after every delivered batch, so it resumes where it
+# left off after a restart; one whose callback raises gets the same batch
+# again on the next poll.
+class ChangeFeed:
+    def __init__(self, poll_ms=CHANGE_FEED_POLL_MS):
+        self.poll = poll_ms / 1000
+        self._lock = Lock()
+        self._poll_lock = Lock()  # one delivery pass at a time, or cursors could go back
+        self._subscribers = []  # [callback, kinds, cursor, name]
+        self._thread = None
+
+    def head(self):
+        with db_connection() as conn:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM change_events").fetchone()[0]
+
+    def subscribe(self, callback, kinds=None, cursor=None, name=None):
+        # Without a cursor: the saved one for `name`, else only new events
+        if cursor is None:
+            cursor = get_change_cursor(name) if name else self.head()
+        with self._lock:
+            self._subscribers.append([callback, set(kinds) if kinds else None, cursor, name])
+            if self._thread is None:
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = [sub for sub in self._subscribers if sub[0] is not callback]
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll)
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            self.poll_once()
+
+    def poll_once(self):
+        # Delivers whatever is pending to every subscriber; returns the event count
+        with self._poll_lock:
+            delivered = self._deliver()
+        metrics.inc('change_feed_events_total', delivered)
+        return delivered
+
+    def _deliver(self):
+        delivered = 0
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            callback, kinds, cursor, name = subscriber
+            events = read_change_events(cursor)
+            if not events:
+                continue
+            wanted = [event for event in events if kinds is None or event['kind'] in kinds]
+            try:
+                if wanted:
+                    callback(wanted)
+            except Exception as error:
+                metrics.inc('change_feed_errors_total')
+                print(f"Change feed subscriber failed: {error}")
+                continue
+            subscriber[2] = events[-1]['id']
+            if name:
+                save_change_cursor(name, subscriber[2])
+            delivered += len(wanted)
+        return delivered
+
+change_feed = ChangeFeed()
+
+transaction_engine = TransactionEngine()
+
 def process_transaction(employee_id, fuel_type, amount):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+    sale, error = transaction_engine.start_sale(employee_id, fuel_type, amount)
+    if error:
+        return None, error
     
-    cursor.execute("SELECT price, stock FROM fuel_types WHERE name = ?", (fuel_type,))
-    fuel_price, fuel_stock = cursor.fetchone()
-    fuel_price = Decimal(str(fuel_price))
-    fuel_stock = Decimal(str(fuel_stock))
-    
-    total_liters = Decimal(amount) / fuel_price
-    
-    if total_liters > fuel_stock:
-        conn.close()
-        return None, "Insufficient fuel stock"
-    
-    pumped_liters = 0
     layout = [[sg.Text('Press and hold Enter to pump fuel')],
               [sg.ProgressBar(100, orientation='h', size=(20, 20), key='progressbar')]]
     window = sg.Window('Fueling', layout, return_keyboard_events=True, finalize=True)
     
-    total_liters = Decimal(amount) / fuel_price
-    pumped_liters = Decimal('0')
-
-    flow_rate = Decimal('0.5')  # liters per second
-    time_increment = Decimal('0.1')  # 0.1 seconds per loop
-    
-    while pumped_liters < total_liters:
-        event, values = window.read(timeout=100)
+    while not sale.done:
+        event, values = window.read(timeout=PUMP_TICK_MS)
         if event == sg.WINDOW_CLOSED:
             break
         if keyboard.is_pressed('enter'):
-            pumped_liters += flow_rate * time_increment
-            if pumped_liters > total_liters:
-                pumped_liters = total_liters
-            progress = int((pumped_liters / total_liters) * 100)
-            window['progressbar'].update(progress)
-        if pumped_liters >= total_liters:
-            break
+            transaction_engine.dispense(sale, PUMP_FLOW_RATE_ML * PUMP_TICK_MS // 1000)
+            window['progressbar'].update(sale.progress)
         
     window.close()
     
-    cursor.execute("UPDATE fuel_types SET stock = stock - ? WHERE name = ?", (float(pumped_liters), fuel_type))
-    
-    cursor.execute('''INSERT INTO transactions (employee_id, fuel_type_id, amount, liters, timestamp)
-                      VALUES (?, (SELECT id FROM fuel_types WHERE name = ?), ?, ?, ?)''',
-                   (employee_id, fuel_type, float(pumped_liters * fuel_price), float(pumped_liters), datetime.datetime.now()))
-    
-    conn.commit()
-    conn.close()
-    
-    return generate_invoice(employee_id, fuel_type, pumped_liters * fuel_price, pumped_liters), None
+    return transaction_engine.complete_sale(sale), None
 
-def generate_invoice(employee_id, fuel_type, amount, liters):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT name FROM employees WHERE id = ?", (employee_id,))
-    employee_name = cursor.fetchone()[0]
-    
-    conn.close()
-    
-    now = datetime.datetime.now()
-    invoice = f"""
-    {COMPANY_NAME}
+# Async pump scheduler settings
+PUMP_COMMIT_BATCH = 50  # finished sales per commit at most
+PUMP_COMMIT_INTERVAL_MS = 200  # longest a finished sale waits for its batch
+PUMP_CLOSE_TIMEOUT = 120  # seconds close() waits for running pumps before hanging them up
+
+# One dispenser running one sale under a PumpScheduler. Simulated pumps have a
+# flow rate and are advanced by the scheduler's clock; metered pumps
+# (flow_rate_ml=None) only move when the controller calls PumpScheduler.meter().
+class PumpSession:
+    def __init__(self, pump, sale, flow_rate_ml, started_at, completed):
+        self.pump = pump
+        self.sale = sale
+        self.flow_rate_ml = flow_rate_ml
+        self.started_at = started_at
+        self.completed = completed  # Future resolving to the invoice text
+
+    async def wait(self):
+        return await self.completed
+
+# Runs many pump sessions in one asyncio loop. A single ticker advances every
+# simulated pump each PUMP_TICK_MS from its own start time and flow rate, and
+# a single writer task commits finished sales in batches through
+# TransactionEngine.complete_sales, off the event loop thread.
+class PumpScheduler:
+    def __init__(self, engine=None, tick_ms=PUMP_TICK_MS, commit_batch=PUMP_COMMIT_BATCH,
+                 commit_interval_ms=PUMP_COMMIT_INTERVAL_MS):
+        self.engine = engine or transaction_engine
+        self.tick = tick_ms / 1000
+        self.commit_batch = commit_batch
+        self.commit_interval = commit_interval_ms / 1000
+        self.sessions = {}  # pump number -> active PumpSession
+        self._finished = None
+        self._tasks = []
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def start(self):
+        self._finished = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._ticker()), asyncio.create_task(self._writer())]
+
+    async def close(self, timeout=PUMP_CLOSE_TIMEOUT):
+        # Lets running pumps finish and the last batch commit, then stops.
+        # Pumps still running after `timeout` (e.g. a metered pump nobody
+        # hangs up) are hung up and billed for what they pumped.
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.sessions and loop.time() < deadline:
+            await asyncio.sleep(self.tick)
+        for pump in list(self.sessions):
+            self.hang_up(pump)
+        await self._finished.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def begin(self, pump, employee_id, fuel_type, amount, flow_rate_ml=PUMP_FLOW_RATE_ML):
+        if pump in self.sessions:
+            return None, f"Pump {pump} is busy"
+        sale, error = await asyncio.to_thread(self.engine.start_sale, employee_id, fuel_type, amount)
+        if error:
+            return None, error
+        loop = asyncio.get_running_loop()
+        session = PumpSession(pump, sale, flow_rate_ml, loop.time(), loop.create_future())
+        self.sessions[pump] = session
+        return session, None
+
+    def meter(self, pump, ml):
+        session = self.sessions[pump]
+        self.engine.dispense(session.sale, ml)
+        if session.sale.done:
+            self._finish(pump)
+
+    def hang_up(self, pump):
+        # Nozzle back before the prepaid amount: bill what was pumped
+        if pump in self.sessions:
+            self._finish(pump)
+
+    def _finish(self, pump):
+        self._finished.put_nowait(self.sessions.pop(pump))
+
+    async def _ticker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.tick)
+            now = loop.time()
+            for pump, session in list(self.sessions.items()):
+                if session.flow_rate_ml is None:
+                    continue
+                sale = session.sale
+                sale.pumped_ml = min(sale.target_ml, int(session.flow_rate_ml * (now - session.started_at)))
+                if sale.done:
+                    self._finish(pump)
+
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._finished.get()]
+            deadline = loop.time() + self.commit_interval
+            while len(batch) < self.commit_batch:
+                try:
+                    batch.append(await asyncio.wait_for(self._finished.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+            results = await asyncio.to_thread(self._commit, [session.sale for session in batch])
+            for session, (invoice, error) in zip(batch, results):
+                if error is not None:
+                    session.completed.set_exception(error)
+                else:
+                    session.completed.set_result(invoice)
+                    metrics.observe('pump_session_seconds', loop.time() - session.started_at)
+            metrics.inc('pump_commit_batches_total')
+            for _ in batch:
+                self._finished.task_done()
+
+    def _commit(self, sales):
+        # One commit for the whole batch; if that fails, each sale is retried
+        # on its own so one bad sale cannot take the others down with it.
+        # Returns an (invoice, error) pair per sale.
+        try:
+            return [(invoice, None) for invoice in self.engine.complete_sales(sales)]
+        except Exception:
+            metrics.inc('pump_commit_retries_total')
+        results = []
+        for sale in sales:
+            try:
+                results.append((self.engine.complete_sale(sale), None))
+            except Exception as error:
+                results.append((None, error))
+                try:
+                    self.engine.write_off_sale(sale)
+                except Exception:
+                    metrics.inc('pump_sales_unsettled_total')  # the hold expires with its full amount
+        return results
+
+async def simulate_pumps(pumps, sales, employee_id, fuel_types, amount, flow_rate_ml):
+    # Keeps `pumps` simulated dispensers busy until `sales` sales are done
+    results = {'sales': 0, 'errors': 0}
+    sale_numbers = iter(range(sales))
+
+    async def run_pump(pump):
+        for number in sale_numbers:
+            session, error = await scheduler.begin(pump, employee_id, fuel_types[number % len(fuel_types)],
+                                                   amount, flow_rate_ml)
+            if error:
+                results['errors'] += 1
+                continue
+            await session.wait()
+            results['sales'] += 1
+
+    started = time.perf_counter()
+    async with PumpScheduler() as scheduler:
+        await asyncio.gather(*(run_pump(pump) for pump in range(1, pumps + 1)))
+    results['seconds'] = time.perf_counter() - started
+    return results
+
+# Receipt template, parsed once by compile_template(). Bump the version when
+# changing it; archived receipts keep the text they were printed with.
+INVOICE_TEMPLATE = """
+    {company}
     -------------------------
-    Date: {now.strftime("%Y-%m-%d %H:%M:%S")}
-    Employee: {employee_name}
+    Date: {date:%Y-%m-%d %H:%M:%S}
+    Employee: {employee}
     
     Fuel type: {fuel_type}
     Amount paid: R{amount:.2f}
     Liters dispensed: {liters:.2f}
     
-    Thank you for choosing {COMPANY_NAME}!
+    Thank you for choosing {company}!
     """
-    return invoice
+INVOICE_TEMPLATE_VERSION = 1
+RECEIPT_CHUNK_ROWS = 10000  # rows per fetch when reprinting or backfilling
+
+# Preset deflate dictionary for archived receipts: most of a receipt is this
+# boilerplate, so each one compresses to a few dozen bytes on its own. Never
+# change it, every archived receipt needs it to decompress.
+RECEIPT_DICTIONARY = ("Thank you for choosing Jet Refuels!\n    \n    Liters dispensed: 0.00\n"
+                      "    Amount paid: R0.00\n    Fuel type: Regular Premium Diesel\n    \n"
+                      "    Employee: \n    Date: 2025-01-01 00:00:00\n    -------------------------\n"
+                      "    Jet Refuels\n    ").encode()
 
+def compile_template(template):
+    # Splits a str.format template into literal and field parts once, so a
+    # render is a single join instead of a fresh parse
+    parts = [(literal, field, spec) for literal, field, spec, _ in string.Formatter().parse(template)]
+
+    def render(**fields):
+        return ''.join([literal + (format(fields[field], spec) if field is not None else '')
+                        for literal, field, spec in parts])
+    return render
+
+_render_invoice = compile_template(INVOICE_TEMPLATE)
+
+def render_invoice(employee_name, fuel_type, amount, liters, date=None):
+    return _render_invoice(company=COMPANY_NAME, date=date or datetime.datetime.now(),
+                           employee=employee_name or "Unknown", fuel_type=fuel_type or "Unknown",
+                           amount=amount, liters=liters)
+
+def generate_invoice(employee_id, fuel_type, amount, liters):
+    # Standalone receipt for callers without a loaded sale; the sale path renders from FuelSale
+    with db_connection() as conn:
+        employee_name = transaction_engine._employee_name(conn, employee_id)
+    return render_invoice(employee_name, fuel_type, amount, liters)
+
+def compress_receipt(text):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=RECEIPT_DICTIONARY)
+    return compressor.compress(text.encode()) + compressor.flush()
+
+def decompress_receipt(blob):
+    decompressor = zlib.decompressobj(-15, zdict=RECEIPT_DICTIONARY)
+    return (decompressor.decompress(blob) + decompressor.flush()).decode()
+
+def archive_receipts(conn, receipts):
+    # receipts: (transaction_id, text) pairs; call inside the sale's transaction
+    conn.executemany("INSERT OR REPLACE INTO receipts (transaction_id, template_version, receipt) VALUES (?, ?, ?)",
+                     [(transaction_id, INVOICE_TEMPLATE_VERSION, compress_receipt(text))
+                      for transaction_id, text in receipts])
+
+# {schema} is 'main' or an attached archive file (see attach_source)
+RECEIPT_SELECT = """
+    SELECT t.id, e.name, ft.name, t.amount_cents, t.liters_ml, t.timestamp, r.receipt
+    FROM {schema}.transactions t
+    LEFT JOIN employees e ON t.employee_id = e.id
+    LEFT JOIN fuel_types ft ON t.fuel_type_id = ft.id
+    LEFT JOIN {schema}.receipts r ON r.transaction_id = t.id
+"""
+
+def _receipt_from_row(row, rerender):
+    transaction_id, employee_name, fuel_type, amount_cents, liters_ml, timestamp, receipt = row
+    if receipt is not None and not rerender:
+        return decompress_receipt(receipt)
+    return render_invoice(employee_name, fuel_type, Money(amount_cents), Volume(liters_ml),
+                          datetime.datetime.fromisoformat(timestamp))
+
+def get_receipt(transaction_id, rerender=False):
+    # The archived receipt, or one rendered from the transaction if it predates the archive
+    with db_connection() as conn:
+        with attach_source(conn, transaction_source_for_id(transaction_id)) as schema:
+            row = conn.execute(RECEIPT_SELECT.format(schema=schema) + "WHERE t.id = ?", (transaction_id,)).fetchone()
+    return _receipt_from_row(row, rerender) if row else None
+
+def reprint_receipts(start_date=None, end_date=None, employee_id=None, fuel_type=None, rerender=False,
+                     chunk_rows=RECEIPT_CHUNK_ROWS):
+    # Yields (transaction_id, receipt) in time order for the filtered range,
+    # streaming RECEIPT_CHUNK_ROWS at a time. With rerender, receipts are
+    # produced from the current template instead of the archived text.
+    clauses, params = transaction_filters(start_date, end_date, employee_id, fuel_type)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    for source in transaction_sources(*transaction_range(start_date, end_date)):
+        with db_connection() as conn, attach_source(conn, source) as schema:
+            cursor = conn.execute(RECEIPT_SELECT.format(schema=schema) + f"{where} ORDER BY t.timestamp, t.id", params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_rows)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield row[0], _receipt_from_row(row, rerender)
+            finally:
+                cursor.close()  # the archive cannot be detached under a running statement
+
+def archive_missing_receipts(start_date=None, end_date=None, chunk_rows=RECEIPT_CHUNK_ROWS):
+    # Backfills the archive for transactions recorded before it existed (in
+    # the live database; archived months keep what they had when moved)
+    clauses, params = transaction_filters(start_date, end_date)
+    clauses.append("NOT EXISTS (SELECT 1 FROM receipts r WHERE r.transaction_id = t.id)")
+    archived = 0
+    while True:
+        with write_transaction() as conn:
+            rows = conn.execute(RECEIPT_SELECT.format(schema='main') + f"WHERE {' AND '.join(clauses)} LIMIT ?",
+                                params + [chunk_rows]).fetchall()
+            archive_receipts(conn, [(row[0], _receipt_from_row(row, True)) for row in rows])
+        archived += len(rows)
+        if len(rows) < chunk_rows:
+            return archived
+
+# Shifts and business days. Opening one snapshots every tank; from then on
+# each sale adds to the open records' shift_totals in the transaction that
+# records it (see SALES_ROLLUP_UPSERTS), so closing one and producing its
+# Z-report reads a few rows per fuel however many sales it covered. Tank
+# snapshots carry the lifetime sold and delivered counters as well, so
+#   variance = closing stock - (opening stock + delivered - sold)
+# reconciles a window even while other shifts sell from the same tanks.
+SHIFT_STOCK_SNAPSHOT = '''
+    SELECT ft.id,
+           ft.stock_ml + COALESCE((SELECT SUM(ml) FROM stock_reservations r WHERE r.fuel_type_id = ft.id), 0),
+           COALESCE(s.total_ml, 0), COALESCE(d.delivered_ml, 0)
+    FROM fuel_types ft
+    LEFT JOIN sales_by_fuel s ON s.fuel_type_id = ft.id
+    LEFT JOIN stock_deliveries d ON d.fuel_type_id = ft.id'''
+
+def receive_delivery(fuel_type, ml):
+    # Fuel in from a tanker: tops up the tank and its delivery counter
+    with write_transaction() as conn:
+        row = conn.execute("SELECT id FROM fuel_types WHERE name = ?", (fuel_type,)).fetchone()
+        if row is None:
+            return False
+        conn.execute("UPDATE fuel_types SET stock_ml = stock_ml + ? WHERE id = ?", (ml, row[0]))
+        conn.execute('''INSERT INTO stock_deliveries (fuel_type_id, delivered_ml) VALUES (?, ?)
+                        ON CONFLICT (fuel_type_id) DO UPDATE SET delivered_ml = delivered_ml + excluded.delivered_ml''',
+                     (row[0], ml))
+    return True
+
+def _open_shift_record(conn, kind, employee_id=None, pump=None, business_day=None):
+    now = datetime.datetime.now()
+    cursor = conn.execute('''INSERT INTO shifts (kind, employee_id, pump, business_day, opened_at)
+                             VALUES (?, ?, ?, ?, ?)''',
+                          (kind, employee_id, pump, business_day or now.date().isoformat(), now))
+    shift_id = cursor.lastrowid
+    conn.executemany('''INSERT INTO shift_stock (shift_id, fuel_type_id, opening_stock_ml, opening_sold_ml,
+                                                 opening_delivered_ml)
+                        VALUES (?, ?, ?, ?, ?)''',
+                     [(shift_id,) + tuple(row) for row in conn.execute(SHIFT_STOCK_SNAPSHOT)])
+    return shift_id
+
+def _open_business_day(conn, business_day=None):
+    row = conn.execute("SELECT id FROM shifts WHERE kind = 'day' AND closed_at IS NULL").fetchone()
+    if row is not None:
+        return row[0]
+    return _open_shift_record(conn, 'day', business_day=business_day)
+
+def open_business_day(business_day=None):
+    # Returns the open day's id, opening one (dated today by default) if needed
+    with write_transaction() as conn:
+        return _open_business_day(conn, business_day)
+
+def open_shift(employee_id, pump=None):
+    # One open shift per employee; opens the business day too if there is none
+    employee_id = int(employee_id)
+    with write_transaction() as conn:
+        row = conn.execute("SELECT id FROM shifts WHERE kind = 'shift' AND employee_id = ? AND closed_at IS NULL",
+                           (employee_id,)).fetchone()
+        if row is not None:
+            return row[0]
+        day_id = _open_business_day(conn)
+        business_day = conn.execute("SELECT business_day FROM shifts WHERE id = ?", (day_id,)).fetchone()[0]
+        return _open_shift_record(conn, 'shift', employee_id, pump, business_day)
+
+def get_open_shifts():
+    with db_connection() as conn:
+        return conn.execute('''SELECT id, kind, employee_id, pump, business_day, opened_at FROM shifts
+                               WHERE closed_at IS NULL ORDER BY id''').fetchall()
+
+def z_report(shift_id, conn=None):
+    # Running totals and reconciliation for a shift or day; a closed one
+    # returns the report frozen when it closed, an open one is live so far
+    if conn is None:
+        with db_connection() as conn:
+            return z_report(shift_id, conn)
+    shift = conn.execute('''SELECT kind, employee_id, pump, business_day, opened_at, closed_at, z_report
+                            FROM shifts WHERE id = ?''', (shift_id,)).fetchone()
+    if shift is None:
+        return None
+    if shift[6]:
+        return json.loads(shift[6])
+    live = {row[0]: row[1:] for row in conn.execute(SHIFT_STOCK_SNAPSHOT)} if shift[5] is None else {}
+
+    report = {'shift_id': shift_id, 'kind': shift[0], 'employee_id': shift[1], 'pump': shift[2],
+              'business_day': shift[3], 'opened_at': shift[4], 'closed_at': shift[5],
+              'sales': 0, 'revenue_cents': 0, 'liters_ml': 0, 'fuels': []}
+    for row in conn.execute('''SELECT s.fuel_type_id, ft.name, COALESCE(t.sale_count, 0), COALESCE(t.total_cents, 0),
+                                      COALESCE(t.total_ml, 0), s.opening_stock_ml, s.opening_sold_ml,
+                                      s.opening_delivered_ml, s.closing_stock_ml, s.closing_sold_ml,
+                                      s.closing_delivered_ml
+                               FROM shift_stock s
+                               LEFT JOIN fuel_types ft ON ft.id = s.fuel_type_id
+                               LEFT JOIN shift_totals t ON t.shift_id = s.shift_id AND t.fuel_type_id = s.fuel_type_id
+                               WHERE s.shift_id = ? ORDER BY s.fuel_type_id''', (shift_id,)):
+        fuel_type_id, name, sales, revenue, liters = row[:5]
+        opening = row[5:8]
+        closing = live.get(fuel_type_id, row[8:11]) if shift[5] is None else row[8:11]
+        fuel = {'fuel_type_id': fuel_type_id, 'name': name, 'sales': sales, 'revenue_cents': revenue,
+                'liters_ml': liters, 'opening_stock_ml': opening[0], 'closing_stock_ml': closing[0],
+                'stock_delta_ml': None, 'delivered_ml': None, 'tank_sold_ml': None, 'variance_ml': None}
+        # A tank added or removed mid-shift has only one side to compare
+        if None not in opening and None not in closing:
+            fuel['stock_delta_ml'] = closing[0] - opening[0]
+            fuel['tank_sold_ml'] = closing[1] - opening[1]
+            fuel['delivered_ml'] = closing[2] - opening[2]
+            fuel['variance_ml'] = fuel['stock_delta_ml'] - fuel['delivered_ml'] + fuel['tank_sold_ml']
+        report['fuels'].append(fuel)
+        report['sales'] += sales
+        report['revenue_cents'] += revenue
+        report['liters_ml'] += liters
+    return report
+
+def _flush_sale_journal():
+    # Journaled sales reach shift_totals when they are applied
+    if transaction_engine.journal is not None:
+        transaction_engine.journal.flush()
+
+def _close_shift_record(conn, shift_id):
+    row = conn.execute("SELECT closed_at FROM shifts WHERE id = ?", (shift_id,)).fetchone()
+    if row is None or row[0] is not None:
+        return z_report(shift_id, conn)
+    conn.execute("UPDATE shifts SET closed_at = ? WHERE id = ?", (datetime.datetime.now(), shift_id))
+    conn.executemany('''INSERT INTO shift_stock (shift_id, fuel_type_id, closing_stock_ml, closing_sold_ml,
+                                                 closing_delivered_ml)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (shift_id, fuel_type_id) DO UPDATE SET
+                            closing_stock_ml = excluded.closing_stock_ml,
+                            closing_sold_ml = excluded.closing_sold_ml,
+                            closing_delivered_ml = excluded.closing_delivered_ml''',
+                     [(shift_id,) + tuple(row) for row in conn.execute(SHIFT_STOCK_SNAPSHOT)])
+    report = z_report(shift_id, conn)
+    conn.execute("UPDATE shifts SET z_report = ? WHERE id = ?", (json.dumps(report), shift_id))
+    return report
+
+@metrics.timed('report_seconds', report='close_shift')
+def close_shift(shift_id):
+    # Closes the shift and returns its Z-report (None for an unknown id)
+    _flush_sale_journal()
+    with write_transaction() as conn:
+        return _close_shift_record(conn, shift_id)
+
+@metrics.timed('report_seconds', report='close_business_day')
+def close_business_day():
+    # End of day: closes every shift still open, then the day itself, and
+    # returns the day's Z-report (None if no day was open)
+    _flush_sale_journal()
+    with write_transaction() as conn:
+        row = conn.execute("SELECT id FROM shifts WHERE kind = 'day' AND closed_at IS NULL").fetchone()
+        if row is None:
+            return None
+        for (shift_id,) in conn.execute("SELECT id FROM shifts WHERE kind = 'shift' AND closed_at IS NULL").fetchall():
+            _close_shift_record(conn, shift_id)
+        return _close_shift_record(conn, row[0])
+
+def rebuild_shift_totals(conn=None):
+    # Recomputes shift_totals from `transactions` by each record's time window.
+    # Live rows only: shifts from archived months are closed and keep the
+    # Z-report stored when they closed.
+    if conn is None:
+        with write_transaction() as conn:
+            return rebuild_shift_totals(conn)
+    conn.execute("DELETE FROM shift_totals")
+    conn.execute('''INSERT INTO shift_totals (shift_id, fuel_type_id, sale_count, total_cents, total_ml)
+                    SELECT s.id, t.fuel_type_id, COUNT(*), SUM(t.amount_cents), SUM(t.liters_ml)
+                    FROM shifts s
+                    JOIN transactions t ON t.timestamp >= s.opened_at
+                                       AND (s.closed_at IS NULL OR t.timestamp < s.closed_at)
+                                       AND (s.kind = 'day' OR t.employee_id = s.employee_id)
+                    GROUP BY 1, 2''')
+
+def format_z_report(report):
+    title = (f"Business day {report['business_day']}" if report['kind'] == 'day' else
+             f"Shift {report['shift_id']}: employee {report['employee_id']}"
+             + (f", pump {report['pump']}" if report['pump'] is not None else ""))
+    lines = [f"{COMPANY_NAME} Z-report", title,
+             f"Opened {report['opened_at'][:19]}, " + (f"closed {report['closed_at'][:19]}"
+                                                       if report['closed_at'] else "still open"),
+             "",
+             f"{'fuel':<10}{'sales':>7}{'revenue':>13}{'liters':>11}{'tank +/-':>11}{'delivered':>11}{'variance':>10}"]
+
+    def liters(ml):
+        return f"{Volume(ml):,}" if ml is not None else "-"
+
+    for fuel in report['fuels']:
+        lines.append(f"{fuel['name'] or fuel['fuel_type_id']:<10}{fuel['sales']:>7,}{Money(fuel['revenue_cents']):>13,}"
+                     f"{liters(fuel['liters_ml']):>11}{liters(fuel['stock_delta_ml']):>11}"
+                     f"{liters(fuel['delivered_ml']):>11}{liters(fuel['variance_ml']):>10}")
+    lines.append(f"{'total':<10}{report['sales']:>7,}{Money(report['revenue_cents']):>13,}"
+                 f"{Volume(report['liters_ml']):>11,}")
+    return '\n'.join(lines)
+
+@metrics.timed('report_seconds', report='generate_reports')
 def generate_reports():
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT SUM(amount) FROM transactions")
-    total_sales = cursor.fetchone()[0] or 0
+    with db_connection() as conn:
+        total_sales = Money(conn.execute("SELECT COALESCE(SUM(total_cents), 0) FROM sales_by_fuel").fetchone()[0])
 
-    cursor.execute("""
-        SELECT ft.name, SUM(t.amount)
-        FROM transactions t
-        JOIN fuel_types ft ON t.fuel_type_id = ft.id
-        GROUP BY ft.name
-    """)
-    sales_by_fuel = cursor.fetchall()
+        sales_by_fuel = conn.execute("""
+            SELECT ft.name, r.total_cents / 100.0
+            FROM sales_by_fuel r
+            JOIN fuel_types ft ON r.fuel_type_id = ft.id
+            ORDER BY ft.name
+        """).fetchall()
     
     labels = [row[0] for row in sales_by_fuel]
     sizes = [float(row[1]) for row in sales_by_fuel]
-    fig, ax = plt.subplots()
-    ax.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90)
-    ax.axis('equal')
-    plt.title("Sales by Fuel Type")
+    png = chart_service.render('pie', "Sales by Fuel Type", labels, sizes, figsize=(6.4, 4.8))
     
-    buf = BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    
-    conn.close()
-    
-    return f"Total Sales: R{total_sales:.2f}", buf.getvalue()
+    return f"Total Sales: R{total_sales:.2f}", png
+
+# Bulk import settings
+IMPORT_HASH_WORKERS = os.cpu_count() or 1  # PBKDF2 releases the GIL, so hashing runs in parallel
+
+# Bulk CSV import of employees (id, name, password) and fuel types (name,
+# price, stock). One pass validates every row against the current table,
+# read once, and sorts it into added / updated / unchanged; any error and
+# nothing is written, otherwise the whole file goes in with one executemany
+# per statement in a single transaction. With dry_run the same result comes
+# back without hashing a password or touching the database. Results list the
+# changed rows so screens can patch their tables instead of re-reading them.
+def _read_import_csv(path, columns, required):
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        reader = csv.DictReader(file)
+        header = {name.strip().lower(): name for name in reader.fieldnames or []}
+        missing = [column for column in required if column not in header]
+        if missing:
+            raise ValueError(f"{path}: missing column(s) {', '.join(missing)}")
+        # Line numbers as a spreadsheet shows them: the header is line 1
+        return [(line, {column: (row.get(header[column]) or '').strip() if column in header else ''
+                        for column in columns})
+                for line, row in enumerate(reader, start=2)]
+
+def import_employees(path, dry_run=False):
+    rows = _read_import_csv(path, ('id', 'name', 'password'), ('id', 'name'))
+    with db_connection() as conn:
+        existing = {employee_id: name for employee_id, name in conn.execute("SELECT id, name FROM employees")}
+
+    result = {'rows': len(rows), 'added': [], 'updated': [], 'unchanged': 0, 'errors': [], 'applied': False}
+    seen = set()
+    passwords = {}  # employee id -> new password
+    for line, row in rows:
+        if not row['id'].isdigit() or int(row['id']) <= 0:
+            result['errors'].append(f"line {line}: invalid employee id {row['id']!r}")
+            continue
+        employee_id = int(row['id'])
+        if employee_id in seen:
+            result['errors'].append(f"line {line}: employee {employee_id} appears more than once")
+            continue
+        seen.add(employee_id)
+        if not row['name']:
+            result['errors'].append(f"line {line}: employee {employee_id} has no name")
+        elif employee_id not in existing:
+            if not row['password']:
+                result['errors'].append(f"line {line}: new employee {employee_id} needs a password")
+            else:
+                result['added'].append((employee_id, row['name']))
+                passwords[employee_id] = row['password']
+        elif row['name'] != existing[employee_id] or row['password']:
+            # A password in the file is always a reset: comparing it costs a hash
+            result['updated'].append((employee_id, row['name']))
+            if row['password']:
+                passwords[employee_id] = row['password']
+        else:
+            result['unchanged'] += 1
+    if result['errors'] or dry_run:
+        return result
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=IMPORT_HASH_WORKERS) as executor:
+        hashes = dict(zip(passwords, executor.map(hash_password, passwords.values())))
+    with write_transaction() as conn:
+        conn.executemany("INSERT INTO employees (id, name, password) VALUES (?, ?, ?)",
+                         [(employee_id, name, hashes[employee_id]) for employee_id, name in result['added']])
+        conn.executemany("UPDATE employees SET name = ? WHERE id = ?",
+                         [(name, employee_id) for employee_id, name in result['updated']])
+        conn.executemany("UPDATE employees SET password = ? WHERE id = ?",
+                         [(hashes[employee_id], employee_id) for employee_id, _ in result['updated']
+                          if employee_id in hashes])
+    for employee_id, _ in result['updated']:
+        login_cache.forget('employee', employee_id)
+        transaction_engine.forget_employee(employee_id)
+    result['applied'] = True
+    return result
+
+def import_fuel_types(path, dry_run=False):
+    rows = _read_import_csv(path, ('name', 'price', 'stock'), ('name', 'price'))
+    with db_connection() as conn:
+        # Stock as the screens show it: including what running pumps hold
+        existing = {name: (price, stock) for name, price, stock in conn.execute('''
+            SELECT name, price_cents,
+                   stock_ml + (SELECT COALESCE(SUM(ml), 0) FROM stock_reservations WHERE fuel_type_id = fuel_types.id)
+            FROM fuel_types''')}
+
+    result = {'rows': len(rows), 'added': [], 'updated': [], 'unchanged': 0, 'errors': [], 'applied': False}
+    seen = set()
+    for line, row in rows:
+        name = row['name']
+        if not name:
+            result['errors'].append(f"line {line}: fuel type has no name")
+            continue
+        if name in seen:
+            result['errors'].append(f"line {line}: {name} appears more than once")
+            continue
+        seen.add(name)
+        try:
+            price = Money.parse(row['price']) if row['price'] else None
+            stock = Volume.parse(row['stock']) if row['stock'] else None
+        except (ArithmeticError, ValueError):
+            result['errors'].append(f"line {line}: invalid price or stock for {name}")
+            continue
+        if (price is not None and price <= 0) or (stock is not None and stock < 0):
+            result['errors'].append(f"line {line}: price must be positive and stock not negative for {name}")
+        elif name not in existing:
+            if price is None:
+                result['errors'].append(f"line {line}: new fuel type {name} needs a price")
+            else:
+                result['added'].append((name, price, Volume(stock or 0)))
+        else:
+            old_price, old_stock = existing[name]
+            new = (Money(old_price if price is None else price), Volume(old_stock if stock is None else stock))
+            if new != (old_price, old_stock):
+                result['updated'].append((name,) + new)
+            else:
+                result['unchanged'] += 1
+    if result['errors'] or dry_run:
+        return result
+
+    with write_transaction() as conn:
+        conn.executemany("INSERT INTO fuel_types (name, price_cents, stock_ml) VALUES (?, ?, ?)", result['added'])
+        # Stock is a dip reading, as with Update Stock: running pumps' holds stay reserved
+        conn.executemany('''UPDATE fuel_types SET price_cents = ?,
+                                stock_ml = ? - (SELECT COALESCE(SUM(ml), 0) FROM stock_reservations
+                                                WHERE fuel_type_id = fuel_types.id)
+                            WHERE name = ?''',
+                         [(price, stock, name) for name, price, stock in result['updated']])
+    price_cache.reload()
+    result['applied'] = True
+    return result
+
+def format_import_result(result):
+    if result['errors']:
+        return "\n".join([f"{len(result['errors'])} error(s), nothing imported:"] + result['errors'])
+    verb = "Imported" if result['applied'] else "Would import"
+    return (f"{verb} {result['rows']} rows: {len(result['added'])} added, {len(result['updated'])} updated, "
+            f"{result['unchanged']} unchanged.")
+
+def import_csv_dialog(importer, title):
+    # Dry run first, then apply on confirmation; returns the applied result or None
+    path = sg.popup_get_file(f"{title}: CSV file", file_types=(("CSV", "*.csv"),))
+    if not path:
+        return None
+    try:
+        result = importer(path, dry_run=True)
+    except (OSError, ValueError, csv.Error) as error:
+        sg.popup_error(str(error))
+        return None
+    if result['errors']:
+        sg.popup_scrolled(format_import_result(result), title=title)
+        return None
+    if not (result['added'] or result['updated']):
+        sg.popup(format_import_result(result))
+        return None
+    if sg.popup_yes_no(format_import_result(result) + "\n\nApply these changes?", title=title) != 'Yes':
+        return None
+    result = importer(path)
+    sg.popup(format_import_result(result))
+    return result
 
 def manage_employees():
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    
     def refresh_employee_list():
-        cursor.execute("SELECT id, name FROM employees")
-        return cursor.fetchall()
+        with db_connection() as conn:
+            return conn.execute("SELECT id, name FROM employees").fetchall()
 
     employees = refresh_employee_list()
     
@@ -353,7 +2575,7 @@ def manage_employees():
         [sg.Input(key='-EMP_ID-', size=(10, 1), default_text='ID'),
          sg.Input(key='-EMP_NAME-', size=(20, 1), default_text='Name'),
          sg.Input(key='-EMP_PASS-', size=(20, 1), default_text='Password')],
-        [sg.Button("Add Employee"), sg.Button("Remove Employee"), sg.Button("Back")]
+        [sg.Button("Add Employee"), sg.Button("Remove Employee"), sg.Button("Import CSV"), sg.Button("Back")]
     ]
     window = sg.Window("Manage Employees", layout)
     
@@ -363,29 +2585,46 @@ def manage_employees():
               break
           elif event == "Add Employee":
               if values['-EMP_ID-'] and values['-EMP_NAME-'] and values['-EMP_PASS-']:
-                  cursor.execute("INSERT OR IGNORE INTO employees (id, name, password) VALUES (?, ?, ?)",
-                               (values['-EMP_ID-'], values['-EMP_NAME-'], hashlib.sha256(values['-EMP_PASS-'].encode()).hexdigest()))
-                  conn.commit()
-                  employees = refresh_employee_list()
-                  window['-TABLE-'].update(values=employees)
+                  with db_connection() as conn:
+                      cursor = conn.execute("INSERT OR IGNORE INTO employees (id, name, password) VALUES (?, ?, ?)",
+                                            (values['-EMP_ID-'], values['-EMP_NAME-'],
+                                             hash_password(values['-EMP_PASS-'])))
+                  if cursor.rowcount:
+                      employees.append((cursor.lastrowid, values['-EMP_NAME-']))
+                      window['-TABLE-'].update(values=employees)
           elif event == "Remove Employee":
               if values['-TABLE-']:
                   selected_employee = employees[values['-TABLE-'][0]]
-                  cursor.execute("DELETE FROM employees WHERE id = ?", (selected_employee[0],))
-                  conn.commit()
-                  employees = refresh_employee_list()
+                  with db_connection() as conn:
+                      conn.execute("DELETE FROM employees WHERE id = ?", (selected_employee[0],))
+                  login_cache.forget('employee', selected_employee[0])
+                  transaction_engine.forget_employee(selected_employee[0])
+                  employees.pop(values['-TABLE-'][0])
+                  window['-TABLE-'].update(values=employees)
+          elif event == "Import CSV":
+              result = import_csv_dialog(import_employees, "Import Employees")
+              if result:
+                  # Patch the rows the import changed rather than re-reading the table
+                  rows = {row[0]: i for i, row in enumerate(employees)}
+                  for employee_id, name in result['added'] + result['updated']:
+                      if employee_id in rows:
+                          employees[rows[employee_id]] = (employee_id, name)
+                      else:
+                          employees.append((employee_id, name))
                   window['-TABLE-'].update(values=employees)
     
     window.close()
-    conn.close()
 
 def manage_fuel_types():
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    
+    fuel_type_ids = []  # table row -> fuel_types.id
+
     def refresh_fuel_types():
-        cursor.execute("SELECT name, price, stock FROM fuel_types")
-        return cursor.fetchall()
+        # Direct edits bypass fuel_prices.json, so let the price cache know
+        price_cache.reload()
+        with db_connection() as conn:
+            rows = conn.execute("SELECT id, name, price_cents / 100.0, stock_ml / 1000.0 FROM fuel_types").fetchall()
+        fuel_type_ids[:] = [row[0] for row in rows]
+        return [list(row[1:]) for row in rows]
 
     fuel_types = refresh_fuel_types()
     
@@ -395,95 +2634,461 @@ def manage_fuel_types():
         [sg.Input(key='-FUEL_NAME-', size=(15, 1), default_text='Fuel Name'),
          sg.Input(key='-FUEL_PRICE-', size=(10, 1), default_text='Price'),
          sg.Input(key='-FUEL_STOCK-', size=(10, 1), default_text='Stock')],
-        [sg.Button("Add Fuel Type"), sg.Button("Update Price"), sg.Button("Update Stock"), sg.Button("Remove Fuel Type"), sg.Button("Back")]
+        [sg.Button("Add Fuel Type"), sg.Button("Update Price"), sg.Button("Update Stock"), sg.Button("Receive Delivery"),
+         sg.Button("Remove Fuel Type"), sg.Button("Import CSV"), sg.Button("Back")]
     ]
     
-    window = sg.Window("Manage Fuel Types", layout)
+    window = sg.Window("Manage Fuel Types", layout, finalize=True)
+    # Sales and price updates elsewhere show up as they commit
+    on_change = change_feed.subscribe(lambda events: window.write_event_value('-CHANGES-', events),
+                                      kinds=('price', 'stock', 'fuel_removed'))
     
     while True:
         event, values = window.read()
         if event == sg.WINDOW_CLOSED or event == 'Back':
             break
+        elif event == '-CHANGES-':
+            for change in values['-CHANGES-']:
+                if change['fuel_type_id'] not in fuel_type_ids or change['kind'] == 'fuel_removed':
+                    fuel_types = refresh_fuel_types()
+                    continue
+                row = fuel_types[fuel_type_ids.index(change['fuel_type_id'])]
+                if change['kind'] == 'price':
+                    row[1] = change['price_cents'] / 100
+                else:
+                    row[2] = change['stock_ml'] / 1000
+            window['-TABLE-'].update(values=fuel_types, select_rows=values['-TABLE-'])
         elif event == "Add Fuel Type":
             if values['-FUEL_NAME-'] and values['-FUEL_PRICE-'] and values['-FUEL_STOCK-']:
-                cursor.execute("INSERT OR IGNORE INTO fuel_types (name, price, stock) VALUES (?, ?, ?)",
-                               (values['-FUEL_NAME-'], float(values['-FUEL_PRICE-']), float(values['-FUEL_STOCK-'])))
-                conn.commit()
+                with db_connection() as conn:
+                    conn.execute("INSERT OR IGNORE INTO fuel_types (name, price_cents, stock_ml) VALUES (?, ?, ?)",
+                                 (values['-FUEL_NAME-'], Money.parse(values['-FUEL_PRICE-']), Volume.parse(values['-FUEL_STOCK-'])))
                 fuel_types = refresh_fuel_types()
                 window['-TABLE-'].update(values=fuel_types)
         elif event == "Update Price":
             if values['-TABLE-'] and values['-FUEL_PRICE-']:
                 selected_fuel = fuel_types[values['-TABLE-'][0]]
-                cursor.execute("UPDATE fuel_types SET price = ? WHERE name = ?",
-                               (float(values['-FUEL_PRICE-']), selected_fuel[0]))
-                conn.commit()
+                with db_connection() as conn:
+                    conn.execute("UPDATE fuel_types SET price_cents = ? WHERE name = ?",
+                                 (Money.parse(values['-FUEL_PRICE-']), selected_fuel[0]))
                 fuel_types = refresh_fuel_types()
                 window['-TABLE-'].update(values=fuel_types)
         elif event == "Update Stock":
             if values['-TABLE-'] and values['-FUEL_STOCK-']:
                 selected_fuel = fuel_types[values['-TABLE-'][0]]
-                cursor.execute("UPDATE fuel_types SET stock = ? WHERE name = ?",
-                               (float(values['-FUEL_STOCK-']), selected_fuel[0]))
-                conn.commit()
+                with db_connection() as conn:
+                    # Stock held by pumps that are still running stays reserved
+                    conn.execute('''UPDATE fuel_types SET stock_ml = ? - (SELECT COALESCE(SUM(ml), 0)
+                                                                      FROM stock_reservations
+                                                                      WHERE fuel_type_id = fuel_types.id)
+                                    WHERE name = ?''',
+                                 (Volume.parse(values['-FUEL_STOCK-']), selected_fuel[0]))
+                fuel_types = refresh_fuel_types()
+                window['-TABLE-'].update(values=fuel_types)
+        elif event == "Receive Delivery":
+            # Unlike Update Stock this is not a dip reading: it adds the
+            # delivered liters and keeps them out of the shift variance
+            if values['-TABLE-'] and values['-FUEL_STOCK-']:
+                selected_fuel = fuel_types[values['-TABLE-'][0]]
+                receive_delivery(selected_fuel[0], Volume.parse(values['-FUEL_STOCK-']))
                 fuel_types = refresh_fuel_types()
                 window['-TABLE-'].update(values=fuel_types)
         elif event == "Remove Fuel Type":
             if values['-TABLE-']:
                 selected_fuel = fuel_types[values['-TABLE-'][0]]
-                cursor.execute("DELETE FROM fuel_types WHERE name = ?", (selected_fuel[0],))
-                conn.commit()
+                with db_connection() as conn:
+                    conn.execute("DELETE FROM fuel_types WHERE name = ?", (selected_fuel[0],))
                 fuel_types = refresh_fuel_types()
                 window['-TABLE-'].update(values=fuel_types)
+        elif event == "Import CSV":
+            # The import's price and stock changes reach the table through the change feed
+            import_csv_dialog(import_fuel_types, "Import Fuel Types")
     
+    change_feed.unsubscribe(on_change)
     window.close()
-    conn.close()
+
+# Transaction archive settings
+ARCHIVE_DIR = 'archive'  # next to DATABASE_NAME
+ARCHIVE_KEEP_MONTHS = 1  # closed months kept in the live database besides the current one
+
+ARCHIVE_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS archive.transactions
+       (id INTEGER PRIMARY KEY, employee_id INTEGER, fuel_type_id INTEGER,
+        amount_cents INTEGER, liters_ml INTEGER, timestamp DATETIME)''',
+    "CREATE INDEX IF NOT EXISTS archive.idx_transactions_timestamp ON transactions (timestamp)",
+    '''CREATE INDEX IF NOT EXISTS archive.idx_transactions_employee_timestamp
+       ON transactions (employee_id, timestamp, amount_cents)''',
+    '''CREATE INDEX IF NOT EXISTS archive.idx_transactions_fuel_type_timestamp
+       ON transactions (fuel_type_id, timestamp, amount_cents, liters_ml)''',
+    '''CREATE TABLE IF NOT EXISTS archive.receipts
+       (transaction_id INTEGER PRIMARY KEY, template_version INTEGER NOT NULL, receipt BLOB NOT NULL)''',
+]
+
+# Closed months of `transactions` (and their receipts) move to one SQLite
+# file per month under ARCHIVE_DIR, listed in the archive_partitions
+# manifest, so the live database only holds recent history. Months go in
+# order, oldest first, and always whole, so the live rows are all newer than
+# any archived one and a time-ordered read is the archive files in month
+# order followed by `main`. History readers ask transaction_sources() which
+# files a range touches and ATTACH each one just for its own query.
+def archive_file(month):
+    return f"transactions-{month}.db"
+
+def archive_path(file):
+    return os.path.join(os.path.dirname(os.path.abspath(DATABASE_NAME)), ARCHIVE_DIR, file)
+
+def transaction_sources(start=None, end=None, since_id=None, newest_first=False):
+    # Archive files holding rows in [start, end) or above since_id, then 'main'
+    clauses, params = [], []
+    if start:
+        clauses.append("month >= substr(?, 1, 7)")
+        params.append(str(start))
+    if end:
+        clauses.append("month || '-01' < ?")
+        params.append(str(end))
+    if since_id:
+        clauses.append("last_id > ?")
+        params.append(since_id)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with db_connection() as conn:
+        sources = [row[0] for row in conn.execute(f"SELECT file FROM archive_partitions {where} ORDER BY month",
+                                                  params)]
+        newest = conn.execute("SELECT MAX(month) FROM archive_partitions").fetchone()[0]
+    # Live rows all come after the newest archived month
+    if not (end and newest and str(end) <= _month_after(newest)):
+        sources.append('main')
+    return sources[::-1] if newest_first else sources
+
+def transaction_source_for_id(transaction_id):
+    with db_connection() as conn:
+        row = conn.execute("SELECT file FROM archive_partitions WHERE ? BETWEEN first_id AND last_id",
+                           (transaction_id,)).fetchone()
+    return row[0] if row else 'main'
+
+@contextmanager
+def attach_source(conn, source):
+    # Yields the schema to read `source` from. Not inside a transaction:
+    # SQLite cannot ATTACH there.
+    if source == 'main':
+        yield 'main'
+        return
+    conn.execute("ATTACH DATABASE ? AS archive", (archive_path(source),))
+    try:
+        yield 'archive'
+    finally:
+        conn.execute("DETACH DATABASE archive")
+
+def _month_after(month):
+    # '2024-12' -> '2025-01-01'
+    year, number = map(int, month.split('-'))
+    return f"{year + number // 12:04d}-{number % 12 + 1:02d}-01"
+
+def _archive_month(month):
+    start = f"{month}-01"
+    end = _month_after(month)
+    file = archive_file(month)
+    path = archive_path(file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Another run (the CLI next to the GUI) may be archiving the same month.
+    # Nothing here deletes the file: the copy is an idempotent INSERT OR
+    # REPLACE under the archive file's own lock, left-over rows from a run
+    # that stopped early are all still in `main`, and the manifest and the
+    # delete are taken from the archive's contents in one BEGIN IMMEDIATE,
+    # so only rows that are in the archive file ever leave `main`.
+    with db_connection() as conn:
+        conn.execute("ATTACH DATABASE ? AS archive", (path,))
+        try:
+            # Copy first and commit the archive file on its own...
+            for sql in ARCHIVE_SCHEMA:
+                conn.execute(sql)
+            conn.execute('''INSERT OR REPLACE INTO archive.transactions
+                            SELECT id, employee_id, fuel_type_id, amount_cents, liters_ml, timestamp
+                            FROM main.transactions WHERE timestamp >= ? AND timestamp < ?''', (start, end))
+            conn.execute('''INSERT OR REPLACE INTO archive.receipts
+                            SELECT r.* FROM main.receipts r
+                            JOIN main.transactions t ON t.id = r.transaction_id
+                            WHERE t.timestamp >= ? AND t.timestamp < ?''', (start, end))
+            conn.commit()
+            # ...then record it and delete from the live database in one
+            # transaction that only writes `main`, so it is atomic
+            with metrics.timer('db_lock_wait_seconds'):
+                conn.execute("BEGIN IMMEDIATE")
+            conn.execute('''INSERT OR REPLACE INTO archive_partitions
+                                (month, file, first_id, last_id, row_count, total_cents, total_ml, archived_at)
+                            SELECT ?, ?, MIN(id), MAX(id), COUNT(*), COALESCE(SUM(amount_cents), 0),
+                                   COALESCE(SUM(liters_ml), 0), ?
+                            FROM archive.transactions''', (month, file, datetime.datetime.now()))
+            conn.execute("DELETE FROM main.receipts WHERE transaction_id IN (SELECT id FROM archive.transactions)")
+            moved = conn.execute("DELETE FROM main.transactions WHERE id IN (SELECT id FROM archive.transactions)").rowcount
+            conn.commit()
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute("DETACH DATABASE archive")
+    return moved
+
+def compact_database():
+    # Hands the pages freed by archiving back to the file system
+    with db_connection() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+@metrics.timed('report_seconds', report='archive')
+def archive_closed_months(keep_months=ARCHIVE_KEEP_MONTHS, now=None, compact=True):
+    # Moves every month before the current one and `keep_months` closed ones
+    # to its archive file; returns {month: rows moved}. Cheap when there is
+    # nothing to do: one MIN over the timestamp index.
+    now = now or datetime.datetime.now()
+    months = now.year * 12 + now.month - 1 - keep_months
+    cutoff = f"{months // 12:04d}-{months % 12 + 1:02d}-01"
+    _flush_sale_journal()
+    archived = {}
+    while True:
+        with db_connection() as conn:
+            oldest = conn.execute("SELECT MIN(timestamp) FROM transactions").fetchone()[0]
+            newest = conn.execute("SELECT timestamp FROM transactions ORDER BY id DESC LIMIT 1").fetchone()
+        # The newest row always stays: rowids are max + 1, so emptying the
+        # table would hand out archived ids again
+        if oldest is None or oldest >= cutoff or oldest[:7] == newest[0][:7]:
+            break
+        moved = _archive_month(oldest[:7])
+        if moved:  # zero when a concurrent run got there first
+            archived[oldest[:7]] = moved
+    if archived and compact:
+        compact_database()
+    return archived
+
+archive_thread = None
+
+def archive_in_background():
+    try:
+        archived = archive_closed_months(compact=False)
+    except sqlite3.OperationalError as error:
+        # e.g. an `archive` run from the CLI holds the month's file; it will finish the job
+        print(f"Archiving skipped: {error}")
+        return
+    if archived:
+        print("Archived " + ", ".join(f"{month} ({rows:,} transactions)" for month, rows in archived.items()))
+
+def start_archive_thread():
+    # Once per process: main() runs again each time a window returns to it
+    global archive_thread
+    if archive_thread is None:
+        archive_thread = Thread(target=archive_in_background, daemon=True)
+        archive_thread.start()
+    return archive_thread
+
+def transaction_range(start_date=None, end_date=None):
+    # The [start, end) timestamp bounds transaction_filters() puts on the dates
+    return (start_date.isoformat() if start_date else None,
+            (end_date + datetime.timedelta(days=1)).isoformat() if end_date else None)
+
+def transaction_filters(start_date=None, end_date=None, employee_id=None, fuel_type=None):
+    # WHERE clauses (on `transactions t`) for the common history filters;
+    # end_date is inclusive
+    clauses, params = [], []
+    if start_date:
+        clauses.append("t.timestamp >= ?")
+        params.append(start_date.isoformat())
+    if end_date:
+        clauses.append("t.timestamp < ?")
+        params.append((end_date + datetime.timedelta(days=1)).isoformat())
+    if employee_id:
+        clauses.append("t.employee_id = ?")
+        params.append(employee_id)
+    if fuel_type:
+        clauses.append("t.fuel_type_id = (SELECT id FROM fuel_types WHERE name = ?)")
+        params.append(fuel_type)
+    return clauses, params
+
+# Transaction browser settings
+TRANSACTION_PAGE_SIZE = 100
+TRANSACTION_PAGE_CACHE = 10  # pages kept in memory per browser
+
+# Keyset-paginated view of the transaction history, newest first.
+# Pages are fetched on demand with `(timestamp, id) < last row of the previous
+# page`, so any page costs one index range scan no matter how deep it is, and
+# only the last TRANSACTION_PAGE_CACHE pages stay in memory.
+class TransactionBrowser:
+    def __init__(self, start_date=None, end_date=None, employee_id=None, fuel_type=None,
+                 page_size=TRANSACTION_PAGE_SIZE, cache_pages=TRANSACTION_PAGE_CACHE):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.employee_id = employee_id
+        self.fuel_type = fuel_type
+        self.page_size = page_size
+        self.cache_pages = cache_pages
+        self._pages = OrderedDict()
+        self._page_keys = []  # (timestamp, id) of the last row of each page seen so far
+        self._last_page = None
+
+    def _filters(self):
+        return transaction_filters(self.start_date, self.end_date, self.employee_id, self.fuel_type)
+
+    def _range(self):
+        return transaction_range(self.start_date, self.end_date)
+
+    @metrics.timed('report_seconds', report='transaction_page')
+    def _fetch(self, page_number):
+        clauses, params = self._filters()
+        if page_number > 0:
+            clauses.append("(t.timestamp, t.id) < (?, ?)")
+            params.extend(self._page_keys[page_number - 1])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        start, end = self._range()
+        if page_number > 0:
+            # Archived months newer than the previous page's last row can be skipped
+            key = self._page_keys[page_number - 1][0]
+            end = min(end, key) if end else key
+        rows = []
+        with db_connection() as conn:
+            # Newest first: the live rows, then archived months backwards
+            for source in transaction_sources(start, end, newest_first=True):
+                with attach_source(conn, source) as schema:
+                    rows += conn.execute(f"""
+                        SELECT t.id, e.name, ft.name, t.amount_cents / 100.0, t.liters_ml / 1000.0, t.timestamp
+                        FROM {schema}.transactions t
+                        JOIN employees e ON t.employee_id = e.id
+                        JOIN fuel_types ft ON t.fuel_type_id = ft.id
+                        {where}
+                        ORDER BY t.timestamp DESC, t.id DESC
+                        LIMIT ?
+                    """, (*params, self.page_size - len(rows))).fetchall()
+                if len(rows) == self.page_size:
+                    break
+        if len(rows) < self.page_size:
+            self._last_page = page_number
+        if rows and len(self._page_keys) == page_number:
+            self._page_keys.append((rows[-1][5], rows[-1][0]))
+        return rows
+
+    def page(self, page_number):
+        if page_number in self._pages:
+            self._pages.move_to_end(page_number)
+            return self._pages[page_number]
+        # Walk forward to learn the keys of any pages we have not seen yet
+        while len(self._page_keys) < page_number:
+            if self._last_page is not None and len(self._page_keys) > self._last_page:
+                return []
+            self._cache(len(self._page_keys), self._fetch(len(self._page_keys)))
+        rows = self._fetch(page_number)
+        self._cache(page_number, rows)
+        return rows
+
+    def _cache(self, page_number, rows):
+        self._pages[page_number] = rows
+        self._pages.move_to_end(page_number)
+        while len(self._pages) > self.cache_pages:
+            self._pages.popitem(last=False)
+
+    def has_next(self, page_number):
+        return self._last_page is None or page_number < self._last_page
+
+    def estimate_count(self):
+        # Answered from the rollups where the filters allow it, otherwise from
+        # a COUNT over the matching index range
+        with db_connection() as conn:
+            if self.employee_id and (self.fuel_type or self.start_date or self.end_date):
+                clauses, params = self._filters()
+                count = 0
+                for source in transaction_sources(*self._range()):
+                    with attach_source(conn, source) as schema:
+                        count += conn.execute(f"SELECT COUNT(*) FROM {schema}.transactions t "
+                                              f"WHERE {' AND '.join(clauses)}", params).fetchone()[0]
+                return count
+            if self.employee_id:
+                row = conn.execute("SELECT sale_count FROM sales_by_employee WHERE employee_id = ?",
+                                   (self.employee_id,)).fetchone()
+                return row[0] if row else 0
+            clauses, params = [], []
+            if self.start_date:
+                clauses.append("day >= ?")
+                params.append(self.start_date.isoformat())
+            if self.end_date:
+                clauses.append("day <= ?")
+                params.append(self.end_date.isoformat())
+            if self.fuel_type:
+                clauses.append("fuel_type_id = (SELECT id FROM fuel_types WHERE name = ?)")
+                params.append(self.fuel_type)
+            table = "sales_by_day" if self.start_date or self.end_date else "sales_by_fuel"
+            where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+            return conn.execute(f"SELECT COALESCE(SUM(sale_count), 0) FROM {table} {where}", params).fetchone()[0]
 
 def view_all_transactions():
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT t.id, e.name, ft.name, t.amount, t.liters, t.timestamp
-        FROM transactions t
-        JOIN employees e ON t.employee_id = e.id
-        JOIN fuel_types ft ON t.fuel_type_id = ft.id
-        ORDER BY t.timestamp DESC
-    """)
-    transactions = cursor.fetchall()
+    browser = TransactionBrowser()
+    page_number = 0
     
     layout = [
         [sg.Text("All Transactions", font=('Helvetica', 20))],
-        [sg.Table(values=transactions, headings=['ID', 'Employee', 'Fuel Type', 'Amount', 'Liters', 'Timestamp'], 
-                  auto_size_columns=False, col_widths=[5, 15, 10, 10, 10, 20], justification='left', key='-TABLE-')],
-        [sg.Button("Back")]
+        [sg.Text('From (YYYY-MM-DD):'), sg.Input(key='-FROM-', size=(12, 1)),
+         sg.Text('To:'), sg.Input(key='-TO-', size=(12, 1)),
+         sg.Text('Employee ID:'), sg.Input(key='-EMPLOYEE-', size=(10, 1)),
+         sg.Text('Fuel:'), sg.Combo([''] + list(get_fuel_types()), key='-FUEL-', size=(10, 1), readonly=True),
+         sg.Button("Apply")],
+        [sg.Table(values=browser.page(page_number), headings=['ID', 'Employee', 'Fuel Type', 'Amount', 'Liters', 'Timestamp'], 
+                  auto_size_columns=False, col_widths=[5, 15, 10, 10, 10, 20], justification='left', key='-TABLE-',
+                  num_rows=20)],
+        [sg.Button("Newer"), sg.Button("Older"),
+         sg.Text(f"Page 1 of about {browser.estimate_count():,} transactions", key='-PAGE-', size=(40, 1)),
+         sg.Button("Reprint Receipt"), sg.Button("Export to CSV"), sg.Button("Back")]
     ]
     
-    window = sg.Window("All Transactions", layout, size=(800, 600))
+    window = sg.Window("All Transactions", layout, size=(900, 600), finalize=True)
     
     while True:
         event, values = window.read()
         if event == sg.WINDOW_CLOSED or event == 'Back':
             break
+        elif event == "Apply":
+            try:
+                start_date = datetime.date.fromisoformat(values['-FROM-']) if values['-FROM-'] else None
+                end_date = datetime.date.fromisoformat(values['-TO-']) if values['-TO-'] else None
+                employee_id = int(values['-EMPLOYEE-']) if values['-EMPLOYEE-'] else None
+            except ValueError:
+                sg.popup_error("Dates must be YYYY-MM-DD and the employee ID a number.")
+                continue
+            browser = TransactionBrowser(start_date, end_date, employee_id, values['-FUEL-'] or None)
+            page_number = 0
+        elif event == "Reprint Receipt":
+            if values['-TABLE-']:
+                transaction_id = browser.page(page_number)[values['-TABLE-'][0]][0]
+                sg.popup_scrolled(get_receipt(transaction_id), title=f"Receipt {transaction_id}", size=(50, 14))
+            continue
+        elif event == "Export to CSV":
+            filename = f"transactions_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+            result = export_transactions(filename, browser.start_date, browser.end_date,
+                                         browser.employee_id, browser.fuel_type)
+            sg.popup(f"{result['rows']:,} transactions exported to {filename} "
+                     f"({result['rows_per_second']:,.0f} rows/s)")
+            continue
+        elif event == "Older" and browser.has_next(page_number):
+            page_number += 1
+        elif event == "Newer" and page_number > 0:
+            page_number -= 1
+        else:
+            continue
+        window['-TABLE-'].update(values=browser.page(page_number))
+        window['-PAGE-'].update(f"Page {page_number + 1} of about {browser.estimate_count():,} transactions")
     
     window.close()
-    conn.close()
+
+@metrics.timed('report_seconds', report='worker_stats')
+def get_worker_stats():
+    with db_connection() as conn:
+        return conn.execute("""
+            SELECT e.id, e.name, 
+                   COALESCE(r.sale_count, 0) as transaction_count, 
+                   r.total_cents / 100.0 as total_sales,
+                   r.total_cents / 100.0 / r.sale_count as avg_sale,
+                   r.last_transaction as last_transaction
+            FROM employees e
+            LEFT JOIN sales_by_employee r ON e.id = r.employee_id
+            ORDER BY total_sales DESC
+        """).fetchall()
 
 def worker_tracking():
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT e.id, e.name, 
-               COUNT(t.id) as transaction_count, 
-               SUM(t.amount) as total_sales,
-               AVG(t.amount) as avg_sale,
-               MAX(t.timestamp) as last_transaction
-        FROM employees e
-        LEFT JOIN transactions t ON e.id = t.employee_id
-        GROUP BY e.id
-        ORDER BY total_sales DESC
-    """)
-    worker_stats = cursor.fetchall()
+    worker_stats = get_worker_stats()
     
     layout = [
         [sg.Text("Worker Performance Tracking", font=('Helvetica', 20))],
@@ -504,33 +3109,425 @@ def worker_tracking():
         if event == sg.WINDOW_CLOSED or event == 'Back':
             break
         elif event == "View Performance Graph":
-            plot_worker_performance(worker_stats)
+            post_chart(window, '-GRAPH-', plot_worker_performance(worker_stats))
+        elif event == '-GRAPH-':
+            show_chart("Performance Graph", values['-GRAPH-'])
         elif event == "Export to CSV":
             export_to_csv(worker_stats)
     
     window.close()
-    conn.close()
 
 def plot_worker_performance(worker_stats):
     names = [stat[1] for stat in worker_stats]
     sales = [stat[3] if stat[3] is not None else 0 for stat in worker_stats]
-    
-    plt.figure(figsize=(10, 6))
-    plt.bar(names, sales)
-    plt.title('Worker Sales Performance')
-    plt.xlabel('Employees')
-    plt.ylabel('Total Sales')
-    plt.xticks(rotation=45)
-    
-    buf = BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    
-    layout = [[sg.Image(data=buf.getvalue())]]
-    window = sg.Window("Performance Graph", layout)
-    window.read(close=True)
+    return chart_service.submit('bar', 'Worker Sales Performance', 'Employees', 'Total Sales', names, sales)
+
+# Analytics settings
+ANALYTICS_CHUNK_ROWS = 250_000
+ANALYTICS_CACHE_SIZE = 8  # time ranges kept in memory
+ANALYTICS_PERCENTILES = (50, 90, 99)
+ANALYTICS_PERIODS = ('hour', 'day', 'week')
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+def _bucket_index(hours, period):
+    # `hours` counts hours since 1970-01-01 in the stored (local) time
+    if period == 'hour':
+        return hours
+    days = hours // 24
+    if period == 'day':
+        return days
+    if period == 'week':
+        return (days + 3) // 7  # weeks start on Monday; 1970-01-01 was a Thursday
+    raise ValueError(f"Unknown period: {period}")
+
+def _bucket_start(bucket, period):
+    hours = {'hour': bucket, 'day': bucket * 24, 'week': (bucket * 7 - 3) * 24}[period]
+    return _EPOCH + datetime.timedelta(hours=int(hours))
+
+class SalesAnalytics:
+    # Loads the sales in a time range into NumPy columns once, in chunks,
+    # and answers every cut (hour/day/week totals, ticket percentiles,
+    # employee-by-hour heatmap) from those arrays in a vectorised pass.
+    # Reads this terminal's transactions, or with `central_path` all sites
+    # in a central sync database. Loaded ranges are cached and dropped as
+    # soon as new sales arrive.
+    def __init__(self, central_path=None, cache_size=ANALYTICS_CACHE_SIZE, chunk_rows=ANALYTICS_CHUNK_ROWS):
+        self.central_path = central_path
+        self.cache_size = cache_size
+        self.chunk_rows = chunk_rows
+        self._cache = OrderedDict()  # (start, end, data version) -> {'columns': ..., 'results': {}}
+        self._lock = Lock()
+
+    @contextmanager
+    def _connection(self):
+        if self.central_path is None:
+            with db_connection() as conn:
+                yield conn
+        else:
+            central = open_central_database(self.central_path)
+            try:
+                yield central
+            finally:
+                central.close()
+
+    def _query(self, start, end):
+        if self.central_path is None:
+            table, employee = "{schema}.transactions", "employee_id"
+            version = "SELECT MAX(id) FROM transactions"
+        else:
+            table, employee = "site_transactions", "site_id || ':' || employee_id"
+            version = "SELECT SUM(last_id) FROM sites"
+        clauses, params = [], []
+        if start:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end:
+            clauses.append("timestamp < ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"""SELECT CAST(strftime('%s', timestamp) AS INTEGER) / 3600, {employee}, amount_cents, liters_ml
+                  FROM {table} {where}"""
+        return sql, params, version
+
+    @metrics.timed('report_seconds', report='analytics')
+    def _entry(self, start, end):
+        sql, params, version_sql = self._query(start, end)
+        with self._connection() as conn:
+            key = (start, end, conn.execute(version_sql).fetchone()[0])
+            with self._lock:
+                entry = self._cache.get(key)
+                if entry is not None:
+                    self._cache.move_to_end(key)
+                    return entry
+
+            hours, employees, amounts, liters = [], [], [], []
+            sources = transaction_sources(start, end) if self.central_path is None else ['main']
+            for source in sources:
+                with attach_source(conn, source) as schema:
+                    cursor = conn.execute(sql.format(schema=schema), params)
+                    while True:
+                        rows = cursor.fetchmany(self.chunk_rows)
+                        if not rows:
+                            break
+                        chunk_hours, chunk_employees, chunk_amounts, chunk_liters = zip(*rows)
+                        hours.append(np.array(chunk_hours, dtype=np.int64))
+                        employees.append(np.array(chunk_employees))
+                        amounts.append(np.array(chunk_amounts, dtype=np.int64))
+                        liters.append(np.array(chunk_liters, dtype=np.int64))
+
+        def join(chunks, dtype):
+            return np.concatenate(chunks) if chunks else np.zeros(0, dtype=dtype)
+        entry = {'columns': {'hour': join(hours, np.int64), 'employee': join(employees, np.int64),
+                             'amount_cents': join(amounts, np.int64), 'liters_ml': join(liters, np.int64)},
+                 'results': {}}
+        with self._lock:
+            for stale in [cached for cached in self._cache if cached[:2] == key[:2]]:
+                del self._cache[stale]
+            self._cache[key] = entry
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return entry
+
+    def report(self, start=None, end=None, period='day'):
+        # Per bucket: start, sales, revenue_cents, liters_ml, avg_ticket_cents
+        # and p50/p90/p99 ticket in cents. Empty buckets inside the range are kept.
+        entry = self._entry(start, end)
+        if period in entry['results']:
+            return entry['results'][period]
+        columns = entry['columns']
+        amounts = columns['amount_cents']
+        buckets = _bucket_index(columns['hour'], period)
+
+        if len(buckets) == 0:
+            result = {'period': period, 'start': [], 'sales': np.zeros(0, dtype=np.int64)}
+            for name in ['revenue_cents', 'liters_ml', 'avg_ticket_cents'] + [f'p{q}' for q in ANALYTICS_PERCENTILES]:
+                result[name] = np.zeros(0, dtype=np.int64)
+            entry['results'][period] = result
+            return result
+
+        first = buckets.min()
+        index = buckets - first
+        size = int(index.max()) + 1
+        sales = np.bincount(index, minlength=size)
+        revenue = np.bincount(index, weights=amounts, minlength=size).round().astype(np.int64)
+        liters = np.bincount(index, weights=columns['liters_ml'], minlength=size).round().astype(np.int64)
+        average = np.zeros(size, dtype=np.int64)
+        np.floor_divide(revenue, sales, out=average, where=sales > 0)
+
+        result = {'period': period, 'start': [_bucket_start(first + i, period) for i in range(size)],
+                  'sales': sales, 'revenue_cents': revenue, 'liters_ml': liters, 'avg_ticket_cents': average}
+        # Percentiles (nearest rank) for every bucket at once: sort by bucket,
+        # then amount, and index into each bucket's run of the sorted amounts
+        sorted_amounts = amounts[np.lexsort((amounts, index))]
+        offsets = np.cumsum(sales) - sales
+        for q in ANALYTICS_PERCENTILES:
+            positions = offsets + (np.maximum(sales, 1) - 1) * q // 100
+            result[f'p{q}'] = np.where(sales > 0, sorted_amounts[np.minimum(positions, len(amounts) - 1)], 0)
+        entry['results'][period] = result
+        return result
+
+    def heatmap(self, start=None, end=None):
+        # Revenue and sale counts per employee (rows) and hour of day (columns)
+        entry = self._entry(start, end)
+        if 'heatmap' in entry['results']:
+            return entry['results']['heatmap']
+        columns = entry['columns']
+        employees, rows = np.unique(columns['employee'], return_inverse=True)
+        cells = rows.reshape(-1) * 24 + columns['hour'] % 24
+        shape = (len(employees), 24)
+        result = {'employees': employees.tolist(),
+                  'sales': np.bincount(cells, minlength=shape[0] * 24).reshape(shape),
+                  'revenue_cents': np.bincount(cells, weights=columns['amount_cents'],
+                                               minlength=shape[0] * 24).round().astype(np.int64).reshape(shape)}
+        entry['results']['heatmap'] = result
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+sales_analytics = SalesAnalytics()
+
+# Transaction export settings
+EXPORT_CHUNK_ROWS = 10000
+EXPORT_COLUMNS = ['ID', 'Employee ID', 'Employee', 'Fuel Type', 'Amount', 'Liters', 'Timestamp']
+
+class _CsvExportWriter:
+    def __init__(self, filename):
+        if filename.endswith('.gz'):
+            self._file = gzip.open(filename, 'wt', newline='', compresslevel=6)
+        else:
+            self._file = open(filename, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(EXPORT_COLUMNS)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+class _ParquetExportWriter:
+    # Columnar output, one row group per chunk; needs pyarrow
+    def __init__(self, filename):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+        self._pa = pyarrow
+        self._schema = pyarrow.schema([('id', pyarrow.int64()), ('employee_id', pyarrow.int64()),
+                                       ('employee', pyarrow.string()), ('fuel_type', pyarrow.string()),
+                                       ('amount', pyarrow.float64()), ('liters', pyarrow.float64()),
+                                       ('timestamp', pyarrow.string())])
+        self._writer = pyarrow.parquet.ParquetWriter(filename, self._schema, compression='zstd')
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        self._writer.write_table(self._pa.Table.from_arrays(
+            [self._pa.array(column, type=field.type) for column, field in zip(columns, self._schema)],
+            schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+def get_export_checkpoint(name):
+    with db_connection() as conn:
+        row = conn.execute("SELECT last_id FROM export_checkpoints WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+@metrics.timed('report_seconds', report='export')
+def export_transactions(filename, start_date=None, end_date=None, employee_id=None, fuel_type=None,
+                        checkpoint=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    # Streams matching transactions to `filename` in id order, EXPORT_CHUNK_ROWS
+    # at a time, so memory stays flat however long the history is. The format
+    # follows the extension: .csv, .csv.gz or .parquet. With `checkpoint`, only
+    # rows newer than that checkpoint's last export are written and the
+    # checkpoint moves forward once the file is complete.
+    clauses, params = transaction_filters(start_date, end_date, employee_id, fuel_type)
+    since_id = None
+    if checkpoint:
+        since_id = get_export_checkpoint(checkpoint)
+        clauses.append("t.id > ?")
+        params.append(since_id)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    # A date range is read in timestamp index order so SQLite never has to sort
+    order = "t.timestamp, t.id" if start_date or end_date else "t.id"
+
+    started = time.perf_counter()
+    exported, last_id = 0, None
+    writer = _ParquetExportWriter(filename) if filename.endswith('.parquet') else _CsvExportWriter(filename)
+    try:
+        for source in transaction_sources(*transaction_range(start_date, end_date), since_id=since_id):
+            with db_connection() as conn, attach_source(conn, source) as schema:
+                cursor = conn.execute(f"""
+                    SELECT t.id, t.employee_id, e.name, ft.name, t.amount_cents / 100.0, t.liters_ml / 1000.0,
+                           t.timestamp
+                    FROM {schema}.transactions t
+                    LEFT JOIN employees e ON t.employee_id = e.id
+                    LEFT JOIN fuel_types ft ON t.fuel_type_id = ft.id
+                    {where}
+                    ORDER BY {order}
+                """, params)
+                while True:
+                    rows = cursor.fetchmany(chunk_rows)
+                    if not rows:
+                        break
+                    writer.write(rows)
+                    exported += len(rows)
+                    last_id = max(last_id or 0, max(row[0] for row in rows))
+    finally:
+        writer.close()
+
+    if checkpoint and last_id is not None:
+        with write_transaction() as conn:
+            conn.execute('''INSERT INTO export_checkpoints (name, last_id, exported_at) VALUES (?, ?, ?)
+                            ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id,
+                                                             exported_at = excluded.exported_at''',
+                         (checkpoint, last_id, datetime.datetime.now()))
+
+    seconds = time.perf_counter() - started
+    return {'filename': filename, 'rows': exported, 'seconds': seconds,
+            'rows_per_second': exported / seconds if seconds else 0.0}
+
+# Multi-site sync settings
+SITE_ID = os.environ.get('FUEL_SITE_ID') or socket.gethostname()
+SYNC_BATCH_ROWS = 5000
+
+# The central store: one row per site, every site's transactions keyed by
+# (site, local id), each site's last reported fuel prices and stock, and a
+# per-site sales rollup for consolidated reports. Fuel types are matched by
+# name since ids differ between terminals.
+CENTRAL_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sites
+    (site_id TEXT PRIMARY KEY, last_id INTEGER NOT NULL, synced_at DATETIME);
+CREATE TABLE IF NOT EXISTS site_transactions
+    (site_id TEXT, id INTEGER, employee_id INTEGER, fuel_type TEXT,
+     amount_cents INTEGER, liters_ml INTEGER, timestamp DATETIME,
+     PRIMARY KEY (site_id, id)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_site_transactions_timestamp ON site_transactions (timestamp);
+CREATE TABLE IF NOT EXISTS site_fuel_types
+    (site_id TEXT, name TEXT, price_cents INTEGER, stock_ml INTEGER, reported_at DATETIME,
+     PRIMARY KEY (site_id, name));
+CREATE TABLE IF NOT EXISTS site_sales_by_fuel
+    (site_id TEXT, fuel_type TEXT, sale_count INTEGER NOT NULL, total_cents INTEGER NOT NULL,
+     total_ml INTEGER NOT NULL, PRIMARY KEY (site_id, fuel_type));
+'''
+
+def open_central_database(path):
+    # Autocommit connection; apply_sync_batch manages its own transactions
+    central = sqlite3.connect(path, timeout=DB_TIMEOUT, isolation_level=None)
+    for pragma, value in DB_PRAGMAS.items():
+        central.execute(f"PRAGMA {pragma} = {value}")
+    central.executescript(CENTRAL_SCHEMA)
+    return central
+
+def central_high_water_mark(central, site_id=None):
+    row = central.execute("SELECT last_id FROM sites WHERE site_id = ?", (site_id or SITE_ID,)).fetchone()
+    return row[0] if row else 0
+
+def build_sync_batch(since_id, limit=SYNC_BATCH_ROWS, site_id=None):
+    # Next `limit` transactions after `since_id` plus the current fuel prices
+    # and stock, as gzipped JSON. Returns (batch bytes, transaction count).
+    transactions = []
+    with db_connection() as conn:
+        # Archived months first, for a site that falls behind by more than ARCHIVE_KEEP_MONTHS
+        for source in transaction_sources(since_id=since_id):
+            with attach_source(conn, source) as schema:
+                transactions += conn.execute(f"""
+                    SELECT t.id, t.employee_id, COALESCE(ft.name, 'fuel type ' || t.fuel_type_id), t.amount_cents,
+                           t.liters_ml, t.timestamp
+                    FROM {schema}.transactions t
+                    LEFT JOIN fuel_types ft ON t.fuel_type_id = ft.id
+                    WHERE t.id > ?
+                    ORDER BY t.id
+                    LIMIT ?
+                """, (since_id, limit - len(transactions))).fetchall()
+            if len(transactions) == limit:
+                break
+        fuel_types = conn.execute("SELECT name, price_cents, stock_ml FROM fuel_types").fetchall()
+    batch = {'site_id': site_id or SITE_ID, 'reported_at': adapt_datetime(datetime.datetime.now()),
+             'transactions': transactions, 'fuel_types': fuel_types}
+    return gzip.compress(json.dumps(batch, separators=(',', ':')).encode(), compresslevel=6), len(transactions)
+
+def apply_sync_batch(central, batch):
+    # Idempotent: transactions at or below the site's high-water mark are
+    # skipped, so a batch can be resent after a lost acknowledgement. Prices
+    # and stock belong to the reporting site; an older report (a batch
+    # delivered late) never overwrites a newer one.
+    batch = json.loads(gzip.decompress(batch))
+    site_id = batch['site_id']
+    central.execute("BEGIN IMMEDIATE")
+    try:
+        last_id = central_high_water_mark(central, site_id)
+        rows = [{'site_id': site_id, 'id': row[0], 'employee_id': row[1], 'fuel_type': row[2],
+                 'amount_cents': row[3], 'liters_ml': row[4], 'timestamp': row[5]}
+                for row in batch['transactions'] if row[0] > last_id]
+        central.executemany('''INSERT INTO site_transactions
+                                (site_id, id, employee_id, fuel_type, amount_cents, liters_ml, timestamp)
+                                VALUES (:site_id, :id, :employee_id, :fuel_type, :amount_cents, :liters_ml, :timestamp)''',
+                            rows)
+        central.executemany('''INSERT INTO site_sales_by_fuel (site_id, fuel_type, sale_count, total_cents, total_ml)
+                                VALUES (:site_id, :fuel_type, 1, :amount_cents, :liters_ml)
+                                ON CONFLICT (site_id, fuel_type) DO UPDATE SET
+                                    sale_count = sale_count + 1,
+                                    total_cents = total_cents + excluded.total_cents,
+                                    total_ml = total_ml + excluded.total_ml''', rows)
+        central.executemany('''INSERT INTO site_fuel_types (site_id, name, price_cents, stock_ml, reported_at)
+                                VALUES (?, ?, ?, ?, ?)
+                                ON CONFLICT (site_id, name) DO UPDATE SET
+                                    price_cents = excluded.price_cents,
+                                    stock_ml = excluded.stock_ml,
+                                    reported_at = excluded.reported_at
+                                WHERE excluded.reported_at > site_fuel_types.reported_at''',
+                            [(site_id, name, price, stock, batch['reported_at'])
+                             for name, price, stock in batch['fuel_types']])
+        if rows:
+            last_id = rows[-1]['id']
+        central.execute('''INSERT INTO sites (site_id, last_id, synced_at) VALUES (?, ?, ?)
+                           ON CONFLICT (site_id) DO UPDATE SET last_id = excluded.last_id,
+                                                               synced_at = excluded.synced_at''',
+                        (site_id, last_id, adapt_datetime(datetime.datetime.now())))
+        central.execute("COMMIT")
+    except BaseException:
+        central.execute("ROLLBACK")
+        raise
+    return {'site_id': site_id, 'rows': len(rows), 'last_id': last_id}
+
+def sync_to_central(central_path, site_id=None, batch_rows=SYNC_BATCH_ROWS):
+    # Ships everything the central store has not seen from this terminal,
+    # starting from the high-water mark the central store holds for it
+    site_id = site_id or SITE_ID
+    started = time.perf_counter()
+    result = {'site_id': site_id, 'rows': 0, 'batches': 0, 'bytes': 0}
+    central = open_central_database(central_path)
+    try:
+        while True:
+            batch, count = build_sync_batch(central_high_water_mark(central, site_id), batch_rows, site_id)
+            applied = apply_sync_batch(central, batch)
+            result['rows'] += applied['rows']
+            result['batches'] += 1
+            result['bytes'] += len(batch)
+            if count < batch_rows:
+                break
+    finally:
+        central.close()
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+def central_price_conflicts(central):
+    # Fuel types whose latest reported price differs between sites
+    return central.execute("""
+        SELECT name, GROUP_CONCAT(site_id || '=' || price_cents, ', ')
+        FROM site_fuel_types
+        GROUP BY name
+        HAVING COUNT(DISTINCT price_cents) > 1
+        ORDER BY name
+    """).fetchall()
+
 def export_to_csv(data):
-    filename = f"worker_stats_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    filename = f"worker_stats_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
     with open(filename, 'w', newline='') as file:
         writer = csv.writer(file)
         writer.writerow(['ID', 'Employee', 'Transactions', 'Total Sales', 'Avg Sale', 'Last Transaction'])
@@ -579,21 +3576,7 @@ def admin_update_prices():
     window.close()
     
 def worker_tracking():
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT e.id, e.name, 
-               COUNT(t.id) as transaction_count, 
-               SUM(t.amount) as total_sales,
-               AVG(t.amount) as avg_sale,
-               MAX(t.timestamp) as last_transaction
-        FROM employees e
-        LEFT JOIN transactions t ON e.id = t.employee_id
-        GROUP BY e.id
-        ORDER BY total_sales DESC
-    """)
-    worker_stats = cursor.fetchall()
+    worker_stats = get_worker_stats()
     
     layout = [
         [sg.Text("Worker Performance Tracking", font=('Helvetica', 20))],
@@ -614,12 +3597,178 @@ def worker_tracking():
         if event == sg.WINDOW_CLOSED or event == 'Back':
             break
         elif event == "View Performance Graph":
-            plot_worker_performance(worker_stats)
+            post_chart(window, '-GRAPH-', plot_worker_performance(worker_stats))
+        elif event == '-GRAPH-':
+            show_chart("Performance Graph", values['-GRAPH-'])
         elif event == "Export to CSV":
             export_to_csv(worker_stats)
     
     window.close()
-    conn.close()
+
+def manage_shifts():
+    layout = [
+        [sg.Text("Shifts", font=('Helvetica', 20))],
+        [sg.Table(values=get_open_shifts(), headings=['ID', 'Kind', 'Employee', 'Pump', 'Day', 'Opened'],
+                  auto_size_columns=False, col_widths=[5, 6, 10, 5, 12, 20], justification='left', key='-TABLE-')],
+        [sg.Input(key='-EMPLOYEE-', size=(10, 1), default_text='Employee ID'),
+         sg.Input(key='-PUMP-', size=(6, 1), default_text='Pump')],
+        [sg.Button("Open Shift"), sg.Button("Close Shift"), sg.Button("Z-Report"), sg.Button("Open Day"),
+         sg.Button("Close Day"), sg.Button("Back")]
+    ]
+
+    window = sg.Window("Shifts", layout)
+
+    while True:
+        event, values = window.read()
+        if event == sg.WINDOW_CLOSED or event == 'Back':
+            break
+        shifts = window['-TABLE-'].get()
+        selected = shifts[values['-TABLE-'][0]][0] if values['-TABLE-'] else None
+        report = None
+        if event == "Open Shift":
+            if values['-EMPLOYEE-'].isdigit():
+                open_shift(values['-EMPLOYEE-'], int(values['-PUMP-']) if values['-PUMP-'].isdigit() else None)
+            else:
+                sg.popup_error("Enter an employee ID.")
+        elif event == "Close Shift" and selected:
+            report = close_shift(selected)
+        elif event == "Z-Report" and selected:
+            report = z_report(selected)
+        elif event == "Open Day":
+            open_business_day()
+        elif event == "Close Day":
+            report = close_business_day()
+        if report:
+            sg.popup_scrolled(format_z_report(report), title="Z-Report", font=('Courier', 10), size=(80, 20))
+        window['-TABLE-'].update(values=get_open_shifts())
+
+    window.close()
+
+# Live dashboard settings
+DASHBOARD_REFRESH_MS = 2000
+DASHBOARD_WINDOW = datetime.timedelta(hours=1)  # "sales in the last hour"
+DASHBOARD_TOP_ATTENDANTS = 5
+
+# State behind the live dashboard. The first refresh reads today's and the
+# last hour's transactions through the timestamp index; after that each
+# refresh only reads rows above the transaction id high-water mark and folds
+# them into running totals, while sales older than the hour drop off the
+# front of a deque. Stock and running pumps come from fuel_types and
+# stock_reservations, which hold a row per tank and per running pump.
+class LiveDashboard:
+    def __init__(self):
+        self.high_water = None
+        self.day = None
+        self.recent = deque()  # (timestamp, amount_cents, liters_ml) within DASHBOARD_WINDOW
+        self.recent_cents = self.recent_ml = 0
+        self.attendants = {}  # employee_id -> [sales, cents, ml] for today
+        self._names = {}
+
+    def _employee_names(self, conn, employee_ids):
+        missing = [employee_id for employee_id in employee_ids if employee_id not in self._names]
+        if missing:
+            rows = conn.execute(f"SELECT id, name FROM employees WHERE id IN ({', '.join('?' * len(missing))})",
+                                missing).fetchall()
+            self._names.update({employee_id: None for employee_id in missing})
+            self._names.update(rows)
+        return self._names
+
+    def _add(self, employee_id, amount_cents, liters_ml, timestamp, window_start):
+        if timestamp >= window_start:
+            self.recent.append((timestamp, amount_cents, liters_ml))
+            self.recent_cents += amount_cents
+            self.recent_ml += liters_ml
+        if timestamp.startswith(self.day):
+            totals = self.attendants.setdefault(employee_id, [0, 0, 0])
+            totals[0] += 1
+            totals[1] += amount_cents
+            totals[2] += liters_ml
+
+    @metrics.timed('report_seconds', report='dashboard')
+    def refresh(self, now=None):
+        now = now or datetime.datetime.now()
+        window_start = adapt_datetime(now - DASHBOARD_WINDOW)
+        with db_connection() as conn:
+            if self.day != now.date().isoformat():
+                self.day = now.date().isoformat()
+                self.attendants = {}
+            if self.high_water is None:
+                # High-water mark first: a sale committed between the two
+                # reads is then left to the next refresh instead of neither
+                self.high_water = conn.execute("SELECT COALESCE(MAX(id), 0) FROM transactions").fetchone()[0]
+                since = min(self.day, window_start)
+                rows = conn.execute('''SELECT id, employee_id, amount_cents, liters_ml, timestamp FROM transactions
+                                       WHERE timestamp >= ? AND id <= ? ORDER BY timestamp''',
+                                    (since, self.high_water)).fetchall()
+            else:
+                rows = conn.execute('''SELECT id, employee_id, amount_cents, liters_ml, timestamp FROM transactions
+                                       WHERE id > ? ORDER BY id''', (self.high_water,)).fetchall()
+                if rows:
+                    self.high_water = rows[-1][0]
+            for _, employee_id, amount_cents, liters_ml, timestamp in rows:
+                self._add(employee_id, amount_cents, liters_ml, timestamp, window_start)
+            while self.recent and self.recent[0][0] < window_start:
+                _, amount_cents, liters_ml = self.recent.popleft()
+                self.recent_cents -= amount_cents
+                self.recent_ml -= liters_ml
+
+            pumps = conn.execute('''SELECT r.employee_id, ft.name, r.ml, r.created_at FROM stock_reservations r
+                                    LEFT JOIN fuel_types ft ON ft.id = r.fuel_type_id
+                                    ORDER BY r.created_at''').fetchall()
+            top = sorted(self.attendants.items(), key=lambda item: item[1][1], reverse=True)[:DASHBOARD_TOP_ATTENDANTS]
+            names = self._employee_names(conn, [employee_id for employee_id, _ in top] +
+                                         [pump[0] for pump in pumps])
+        return {'high_water': self.high_water,
+                'stock': stock_forecast.forecast(),
+                'last_hour': {'sales': len(self.recent), 'revenue_cents': self.recent_cents,
+                              'liters_ml': self.recent_ml},
+                'active_pumps': [{'employee_id': employee_id, 'employee': names.get(employee_id), 'fuel_type': fuel,
+                                  'held_ml': ml, 'started_at': started_at}
+                                 for employee_id, fuel, ml, started_at in pumps],
+                'top_attendants': [{'employee_id': employee_id, 'employee': names.get(employee_id),
+                                    'sales': sales, 'revenue_cents': cents, 'liters_ml': ml}
+                                   for employee_id, (sales, cents, ml) in top]}
+
+def live_dashboard():
+    dashboard = LiveDashboard()
+    layout = [
+        [sg.Text("Live Dashboard", font=('Helvetica', 20))],
+        [sg.Text("", key='-LAST_HOUR-', size=(60, 1))],
+        [sg.Text("Tanks")],
+        [sg.Table(values=[], headings=['Fuel', 'Stock (L)', 'L/hour', 'Empty in (h)', 'Low'], auto_size_columns=False,
+                  col_widths=[12, 12, 10, 12, 5], justification='left', num_rows=4, key='-STOCK-')],
+        [sg.Text("Active pumps")],
+        [sg.Table(values=[], headings=['Employee', 'Fuel', 'Held (L)', 'Started'], auto_size_columns=False,
+                  col_widths=[15, 10, 10, 20], justification='left', num_rows=6, key='-PUMPS-')],
+        [sg.Text("Top attendants today")],
+        [sg.Table(values=[], headings=['Employee', 'Sales', 'Revenue', 'Liters'], auto_size_columns=False,
+                  col_widths=[15, 8, 12, 12], justification='left', num_rows=DASHBOARD_TOP_ATTENDANTS, key='-TOP-')],
+        [sg.Button("Back")]
+    ]
+
+    window = sg.Window("Live Dashboard", layout, finalize=True)
+
+    while True:
+        view = dashboard.refresh()
+        last_hour = view['last_hour']
+        window['-LAST_HOUR-'].update(f"Last hour: {last_hour['sales']:,} sales, R{Money(last_hour['revenue_cents']):,}, "
+                                     f"{Volume(last_hour['liters_ml']):,} L")
+        window['-STOCK-'].update(values=[
+            [tank['name'], f"{Volume(tank['stock_ml']):,}", f"{tank['rate_ml_per_hour'] / 1000:.1f}",
+             f"{tank['hours_left']:.1f}" if tank['hours_left'] is not None else "-", "LOW" if tank['low'] else ""]
+            for tank in view['stock']])
+        window['-PUMPS-'].update(values=[[pump['employee'] or pump['employee_id'], pump['fuel_type'],
+                                          f"{Volume(pump['held_ml']):,}", pump['started_at'][:19]]
+                                         for pump in view['active_pumps']])
+        window['-TOP-'].update(values=[[top['employee'] or top['employee_id'], top['sales'],
+                                        f"R{Money(top['revenue_cents']):,}", f"{Volume(top['liters_ml']):,}"]
+                                       for top in view['top_attendants']])
+
+        event, _ = window.read(timeout=DASHBOARD_REFRESH_MS)
+        if event == sg.WINDOW_CLOSED or event == 'Back':
+            break
+
+    window.close()
   
 def create_admin_ui():  
       sg.theme('DarkBlue13')
@@ -632,13 +3781,20 @@ def create_admin_ui():
          sg.Button('Worker Tracking', size=(20, 1), button_color=('white', '#17A2B8'), border_width=0)],
          [sg.Button('Update Prices', size=(20, 1), button_color=('white', '#DC3545'), border_width=0),
          sg.Button('View Reports', size=(20, 1), button_color=('white', '#6C757D'), border_width=0)],
+          [sg.Button('Shifts', size=(20, 1), button_color=('white', '#6F42C1'), border_width=0),
+         sg.Button('Live Dashboard', size=(20, 1), button_color=('white', '#20C997'), border_width=0)],
           [sg.Button('Exit', size=(20, 1), button_color=('white', '#DC3545'), border_width=0)]
       ]
     
-      return sg.Window('Admin Panel', layout, finalize=True, element_justification='center', font=('Helvetica', 12), size=(500, 300))
+      return sg.Window('Admin Panel', layout, finalize=True, element_justification='center', font=('Helvetica', 12), size=(500, 340))
 
 def main():
     setup_database()
+    # Once a month this moves the month that just aged out to its archive
+    # file. It runs behind the login window and skips the VACUUM, which
+    # would block every sale; `python fuel_system.py archive` compacts.
+    start_archive_thread()
+    update_fuel_prices()
     
     layout = [
         [sg.Text('Select Login Type:', font=('Helvetica', 18), pad=(0, 20))],
@@ -668,6 +3824,10 @@ def employee_main():
     fuel_amount = 0
     selected_fuel = None
     
+    # Price changes arrive on the scheduler thread; hand them to the GUI loop
+    on_price_change = price_cache.subscribe(lambda changes: window.write_event_value('-PRICES-', changes))
+    on_low_stock = subscribe_low_stock_alerts(window)
+    
     while True:
         event, values = window.read(timeout=100)
         if event == sg.WINDOW_CLOSED or event == 'Exit':
@@ -676,19 +3836,21 @@ def employee_main():
             view_reports()
         elif event == 'Update Prices':
             update_fuel_prices()
+        elif event == '-PRICES-':
+            for fuel, price in values['-PRICES-'].items():
+                if price is not None and f'-{fuel.upper()}-' in window.AllKeysDict:
+                    window[f'-{fuel.upper()}-'].update(text=f'{fuel} - R{price:.2f}/liter')
+        elif event == '-LOW_STOCK-':
+            show_low_stock_alerts(values['-LOW_STOCK-'])
         elif event == 'Start Fueling':
-            if update_fuel_prices():
-                sg.popup("Fuel prices updated successfully!")
-            else:
-                sg.popup_error("Failed to update fuel prices.")
             if authenticate_user(values['-ID-'], values['-PASSWORD-']):
                 selected_fuel = next((fuel for fuel in ['REGULAR', 'PREMIUM', 'DIESEL'] if values[f'-{fuel}-']), None)
                 if selected_fuel and values['-AMOUNT-']:
                     try:
-                        fuel_amount = float(values['-AMOUNT-'])
+                        fuel_amount = Money.parse(values['-AMOUNT-'])
                         window['-STATUS-'].update("Authentication successful. Press Enter to start fueling.")
                         fueling_in_progress = True
-                    except ValueError:
+                    except (ValueError, ArithmeticError):
                         sg.popup_error("Invalid amount entered.")
             else:
                 sg.popup_error("Authentication failed.")
@@ -704,6 +3866,8 @@ def employee_main():
         if fueling_in_progress:
             window['-STATUS-'].update("Ready to fuel. Press Enter to start pumping.")
     
+    price_cache.unsubscribe(on_price_change)
+    stock_forecast.unsubscribe(on_low_stock)
     window.close()
 
 def admin_login():
@@ -736,11 +3900,14 @@ def admin_login():
 
 def admin_main():
     window = create_admin_ui()
+    on_low_stock = subscribe_low_stock_alerts(window)
     
     while True:
-        event, _ = window.read()
+        event, values = window.read()
         if event == sg.WINDOW_CLOSED or event == 'Exit':
             break
+        elif event == '-LOW_STOCK-':
+            show_low_stock_alerts(values['-LOW_STOCK-'])
         elif event == 'Manage Employees':
             manage_employees()
         elif event == 'Manage Fuel Types':
@@ -753,10 +3920,200 @@ def admin_main():
             admin_update_prices()
         elif event == 'View Reports':
             view_reports()
+        elif event == 'Shifts':
+            manage_shifts()
+        elif event == 'Live Dashboard':
+            live_dashboard()
     
+    stock_forecast.unsubscribe(on_low_stock)
     window.close()
     main()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=f"{COMPANY_NAME} fuel management system")
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help="serve metrics at http://127.0.0.1:PORT/metrics (or set FUEL_METRICS_PORT)")
+    parser.add_argument('--metrics-file', default=METRICS_FILE,
+                        help="dump metrics to this file periodically and on exit (or set FUEL_METRICS_FILE)")
+    parser.add_argument('--profile', metavar='FILE', help="write a cProfile of the whole run to FILE")
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('rebuild-rollups', help="recompute the sales rollup tables from the transaction history")
+    export = commands.add_parser('export', help="stream transactions to a .csv, .csv.gz or .parquet file")
+    export.add_argument('filename')
+    export.add_argument('--from', dest='start_date', type=datetime.date.fromisoformat, help="YYYY-MM-DD")
+    export.add_argument('--to', dest='end_date', type=datetime.date.fromisoformat, help="YYYY-MM-DD (inclusive)")
+    export.add_argument('--since-last', dest='checkpoint', metavar='NAME',
+                        help="only export rows added since the last export under this checkpoint name")
+    reprint = commands.add_parser('reprint', help="reprint archived receipts by transaction id or date range")
+    reprint.add_argument('--id', type=int, dest='transaction_id')
+    reprint.add_argument('--from', dest='start_date', type=datetime.date.fromisoformat, help="YYYY-MM-DD")
+    reprint.add_argument('--to', dest='end_date', type=datetime.date.fromisoformat, help="YYYY-MM-DD (inclusive)")
+    reprint.add_argument('--rerender', action='store_true', help="render with the current template, not the archived text")
+    reprint.add_argument('--backfill', action='store_true', help="archive receipts for transactions that have none")
+    reprint.add_argument('--out', help="write receipts to this file instead of printing them")
+    shift = commands.add_parser('shift', help="open and close shifts and business days, print Z-reports")
+    shift.add_argument('action', choices=['list', 'open', 'close', 'report', 'open-day', 'close-day'])
+    shift.add_argument('--employee', type=int, help="employee id (open)")
+    shift.add_argument('--pump', type=int, help="pump number (open)")
+    shift.add_argument('--id', type=int, dest='shift_id', help="shift or day id (close, report)")
+    events = commands.add_parser('events', help="print change feed events (sales, prices, stock) as JSON lines")
+    events.add_argument('--since', type=int, help="start after this event id (default: the saved --name cursor, or 0)")
+    events.add_argument('--name', help="consumer name: resume from and save its cursor")
+    events.add_argument('--follow', action='store_true', help="keep printing new events until interrupted")
+    archive = commands.add_parser('archive', help="move closed months of transactions to monthly archive files")
+    archive.add_argument('--keep-months', type=int, default=ARCHIVE_KEEP_MONTHS,
+                         help="closed months to keep in the live database (default: %(default)s)")
+    archive.add_argument('--no-compact', dest='compact', action='store_false', help="skip the VACUUM afterwards")
+    import_ = commands.add_parser('import', help="add or update employees or fuel types from a CSV file")
+    import_.add_argument('table', choices=['employees', 'fuel-types'],
+                         help="employees: id,name,password; fuel-types: name,price,stock")
+    import_.add_argument('file')
+    import_.add_argument('--dry-run', action='store_true', help="validate and report changes without writing")
+    commands.add_parser('forecast', help="depletion rate and projected time-to-empty per fuel")
+    analytics = commands.add_parser('analytics', help="revenue, liters and ticket percentiles per hour, day or week")
+    analytics.add_argument('--from', dest='start_date', type=datetime.date.fromisoformat, help="YYYY-MM-DD")
+    analytics.add_argument('--to', dest='end_date', type=datetime.date.fromisoformat, help="YYYY-MM-DD (inclusive)")
+    analytics.add_argument('--period', choices=ANALYTICS_PERIODS, default='day')
+    analytics.add_argument('--central', help="report on all sites in this central sync database")
+    sync = commands.add_parser('sync', help="ship new transactions, prices and stock to a central database")
+    sync.add_argument('central', help="path of the central SQLite database")
+    sync.add_argument('--site-id', default=SITE_ID, help="this terminal's site id (default: $FUEL_SITE_ID or hostname)")
+    simulate = commands.add_parser('simulate', help="run simulated pumps concurrently through the pump scheduler")
+    simulate.add_argument('--pumps', type=int, default=16)
+    simulate.add_argument('--sales', type=int, default=160)
+    simulate.add_argument('--employee', type=int, default=123456)
+    simulate.add_argument('--amount', default='100.00', help="Rands per sale")
+    simulate.add_argument('--flow-rate', type=int, default=PUMP_FLOW_RATE_ML, help="milliliters per second")
+    simulate.add_argument('--journal', action='store_true', help="acknowledge sales through the group-commit sale journal")
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    if args.metrics_file:
+        start_metrics_dump(args.metrics_file)
+
+    with profiling(args.profile) if args.profile else nullcontext():
+        if args.command == 'rebuild-rollups':
+            setup_database()
+            rebuild_sales_rollups()
+            rebuild_shift_totals()
+            print("Sales rollups rebuilt.")
+        elif args.command == 'simulate':
+            setup_database()
+            if args.journal:
+                open_sale_journal()
+            result = asyncio.run(simulate_pumps(args.pumps, args.sales, args.employee, list(get_fuel_types()),
+                                                args.amount, args.flow_rate))
+            print(f"{result['sales']:,} sales on {args.pumps} pumps in {result['seconds']:.1f}s "
+                  f"({result['sales'] / result['seconds']:,.1f} sales/s), {result['errors']} errors")
+            close_sale_journal()
+        elif args.command == 'reprint':
+            setup_database()
+            if args.backfill:
+                print(f"Archived {archive_missing_receipts(args.start_date, args.end_date):,} receipts.")
+            elif args.transaction_id:
+                print(get_receipt(args.transaction_id, args.rerender) or f"No transaction {args.transaction_id}")
+            else:
+                with open(args.out, 'w') if args.out else nullcontext(sys.stdout) as out:
+                    for _, receipt in reprint_receipts(args.start_date, args.end_date, rerender=args.rerender):
+                        out.write(receipt + '\n')
+        elif args.command == 'shift':
+            setup_database()
+            if args.action == 'list':
+                for shift_id, kind, employee_id, pump, business_day, opened_at in get_open_shifts():
+                    print(f"{shift_id:>6}  {kind:<6}{business_day}  opened {opened_at[:19]}"
+                          + (f"  employee {employee_id}" if employee_id is not None else "")
+                          + (f"  pump {pump}" if pump is not None else ""))
+            elif args.action == 'open':
+                if args.employee is None:
+                    parser.error("shift open needs --employee")
+                print(f"Shift {open_shift(args.employee, args.pump)} open.")
+            elif args.action == 'open-day':
+                print(f"Business day {open_business_day()} open.")
+            else:
+                if args.action == 'close-day':
+                    report = close_business_day()
+                elif args.shift_id is None:
+                    parser.error(f"shift {args.action} needs --id")
+                else:
+                    report = close_shift(args.shift_id) if args.action == 'close' else z_report(args.shift_id)
+                print(format_z_report(report) if report else "Nothing to report.")
+        elif args.command == 'events':
+            setup_database()
+            cursor = args.since if args.since is not None else get_change_cursor(args.name) if args.name else 0
+
+            def print_events(events):
+                for event in events:
+                    print(json.dumps(event), flush=True)
+
+            if args.follow:
+                change_feed.subscribe(print_events, cursor=cursor, name=args.name)
+                try:
+                    while True:
+                        time.sleep(1)
+                except KeyboardInterrupt:
+                    change_feed.unsubscribe(print_events)
+            else:
+                while True:
+                    events = read_change_events(cursor)
+                    if not events:
+                        break
+                    print_events(events)
+                    cursor = events[-1]['id']
+                if args.name:
+                    save_change_cursor(args.name, cursor)
+        elif args.command == 'archive':
+            setup_database()
+            archived = archive_closed_months(args.keep_months, compact=args.compact)
+            for month, rows in archived.items():
+                print(f"{month}: {rows:,} transactions -> {archive_path(archive_file(month))}")
+            print(f"Archived {len(archived)} months." if archived else "Nothing to archive.")
+        elif args.command == 'import':
+            setup_database()
+            importer = import_employees if args.table == 'employees' else import_fuel_types
+            result = importer(args.file, dry_run=args.dry_run)
+            print(format_import_result(result))
+            if result['errors']:
+                sys.exit(1)
+        elif args.command == 'forecast':
+            setup_database()
+            print(f"{'fuel':<12}{'stock (L)':>14}{'L/hour':>10}{'empty in':>12}  empty at")
+            for forecast in stock_forecast.forecast():
+                hours = forecast['hours_left']
+                empty_in = f"{hours:.1f} h" if hours is not None else "-"
+                empty_at = f"{forecast['empty_at']:%Y-%m-%d %H:%M}" if forecast['empty_at'] else "-"
+                print(f"{forecast['name']:<12}{Volume(forecast['stock_ml']):>14,}"
+                      f"{forecast['rate_ml_per_hour'] / 1000:>10.1f}{empty_in:>12}  {empty_at}")
+        elif args.command == 'analytics':
+            setup_database()
+            engine = SalesAnalytics(args.central) if args.central else sales_analytics
+            end = args.end_date + datetime.timedelta(days=1) if args.end_date else None
+            result = engine.report(args.start_date and args.start_date.isoformat(), end and end.isoformat(), args.period)
+            print(f"{'start':<17}{'sales':>8}{'revenue':>14}{'liters':>12}{'avg':>10}"
+                  + ''.join(f"{'p' + str(q):>10}" for q in ANALYTICS_PERCENTILES))
+            for i, start in enumerate(result['start']):
+                if result['sales'][i]:
+                    print(f"{start:%Y-%m-%d %H:%M}{result['sales'][i]:>8,}{Money(result['revenue_cents'][i]):>14,}"
+                          f"{Volume(result['liters_ml'][i]):>12,}{Money(result['avg_ticket_cents'][i]):>10}"
+                          + ''.join(f"{Money(result[f'p{q}'][i]):>10}" for q in ANALYTICS_PERCENTILES))
+        elif args.command == 'sync':
+            setup_database()
+            result = sync_to_central(args.central, args.site_id)
+            print(f"Synced {result['rows']:,} transactions from site {result['site_id']} in {result['batches']} batches "
+                  f"({result['bytes'] / 1024:,.1f} KiB) in {result['seconds']:.1f}s")
+            central = open_central_database(args.central)
+            for name, prices in central_price_conflicts(central):
+                print(f"Price differs between sites for {name}: {prices}")
+            central.close()
+        elif args.command == 'export':
+            setup_database()
+            result = export_transactions(args.filename, args.start_date, args.end_date, checkpoint=args.checkpoint)
+            print(f"Exported {result['rows']:,} transactions to {result['filename']} in {result['seconds']:.1f}s "
+                  f"({result['rows_per_second']:,.0f} rows/s)")
+        else:
+            start_price_update_scheduler()
+            main()
+    if args.metrics_file:
+        metrics.dump(args.metrics_file)
+    close_pool()
             